@@ -1,17 +1,113 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, abort, g, has_request_context, Response, stream_with_context, make_response, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime, date
+from werkzeug.security import generate_password_hash
+from werkzeug.http import is_resource_modified
+from markupsafe import Markup
+from datetime import datetime, date, timedelta
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from functools import partial, wraps
+from sqlalchemy import select, insert, update, delete, event, func, and_, or_, case, literal_column, tuple_, bindparam, union_all, inspect
+from sqlalchemy import table as sql_table, column as sql_column
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from gazetteer import Gazetteer, build_gazetteer, read_source_rows
+from passwords import hash_password, check_password
 import openpyxl
-from openpyxl.styles import Font, Alignment, Border, Side
-from io import BytesIO
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+import asyncio
+import bisect
+import click
+import csv
+import hashlib
+import hmac
+import io
+import json
+import math
 import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import uuid
 
-app = Flask(__name__)
+# instance 目錄（相對路徑的 SQLite 資料庫、變更戳記、離線地址索引、效能分析檔）；INSTANCE_PATH 需為絕對路徑，基準測試以此改用暫存目錄
+app = Flask(__name__, instance_path=os.environ.get('INSTANCE_PATH') or None)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///employee_management.db'
+# 資料庫連線字串：打卡、地址快取與封存使用 SQLite 專用的 upsert 與日期函式，僅支援 SQLite
+database_url = os.environ.get('DATABASE_URL', 'sqlite:///employee_management.db')
+if not database_url.startswith('sqlite:'):
+    raise RuntimeError(f'DATABASE_URL 僅支援 SQLite（sqlite:///...），目前為 {database_url.split(":", 1)[0]}')
+app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 連線池：每個 worker 保留的連線數與尖峰時可額外建立的連線數（記憶體資料庫使用單一連線，不適用）
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+if database_url not in ('sqlite://', 'sqlite:///:memory:'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT', '30')),
+    }
+# SQLite 連線設定（每個新連線都會套用）：WAL 讓讀取不阻擋寫入，busy_timeout 讓多個 worker 同時寫入時排隊等待而非失敗
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+app.config['SQLITE_CACHE_SIZE'] = int(os.environ.get('SQLITE_CACHE_SIZE', '-65536'))  # 負數單位為 KiB，即 64 MB
+app.config['SQLITE_TEMP_STORE'] = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+# 地址快取設定：網格大小（度，0.0005 約 50 公尺）、有效秒數、記憶體筆數上限
+app.config['GEOCODE_CACHE_GRID'] = float(os.environ.get('GEOCODE_CACHE_GRID', '0.0005'))
+app.config['GEOCODE_CACHE_TTL'] = int(os.environ.get('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+app.config['GEOCODE_CACHE_SIZE'] = int(os.environ.get('GEOCODE_CACHE_SIZE', '1024'))
+# 背景地址轉換佇列：打卡時只寫入座標，地址由背景 worker 補上
+app.config['GEOCODE_QUEUE_ENABLED'] = os.environ.get('GEOCODE_QUEUE_ENABLED', '1') == '1'
+app.config['GEOCODE_WORKERS'] = int(os.environ.get('GEOCODE_WORKERS', '2'))
+app.config['GEOCODE_QUEUE_BATCH'] = int(os.environ.get('GEOCODE_QUEUE_BATCH', '50'))
+app.config['GEOCODE_QUEUE_POLL_SECONDS'] = int(os.environ.get('GEOCODE_QUEUE_POLL_SECONDS', '30'))
+app.config['GEOCODE_CLAIM_SECONDS'] = 120
+app.config['GEOCODE_MAX_ATTEMPTS'] = 5
+# 外部地址服務：每次請求的時間上限（秒）、keep-alive 連線池大小，以及斷路器的連續失敗門檻與冷卻秒數
+app.config['GEOCODE_TIMEOUT_SECONDS'] = float(os.environ.get('GEOCODE_TIMEOUT_SECONDS', '2'))
+app.config['GEOCODE_POOL_SIZE'] = int(os.environ.get('GEOCODE_POOL_SIZE', '4'))
+app.config['GEOCODE_BREAKER_FAILURES'] = int(os.environ.get('GEOCODE_BREAKER_FAILURES', '5'))
+app.config['GEOCODE_BREAKER_COOLDOWN'] = float(os.environ.get('GEOCODE_BREAKER_COOLDOWN', '60'))
+# 離線地址索引（flask build-gazetteer 建立）、比對最大距離（公尺），以及離線查不到時是否改查外部服務
+app.config['GAZETTEER_PATH'] = os.environ.get('GAZETTEER_PATH', os.path.join(app.instance_path, 'gazetteer.bin'))
+app.config['GAZETTEER_MAX_DISTANCE_M'] = float(os.environ.get('GAZETTEER_MAX_DISTANCE_M', '100'))
+app.config['GEOCODE_NETWORK_FALLBACK'] = os.environ.get('GEOCODE_NETWORK_FALLBACK', '1') == '1'
+# 批次匯入時計算密碼雜湊的程序數
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+# 密碼雜湊方法；已存的雜湊與此設定不同時，使用者下次登入成功會自動重新雜湊
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+# 登入時同時驗證密碼的請求數上限與排隊等待秒數，超過時回應 503，避免換班尖峰佔滿所有 worker
+app.config['PASSWORD_VERIFY_CONCURRENCY'] = int(os.environ.get('PASSWORD_VERIFY_CONCURRENCY', str(app.config['PASSWORD_HASH_WORKERS'] * 2)))
+app.config['PASSWORD_VERIFY_WAIT_SECONDS'] = float(os.environ.get('PASSWORD_VERIFY_WAIT_SECONDS', '5'))
+# 程序池驗證一次密碼的等待秒數，逾時同樣回應 503
+app.config['PASSWORD_VERIFY_TIMEOUT_SECONDS'] = float(os.environ.get('PASSWORD_VERIFY_TIMEOUT_SECONDS', '10'))
+# 登入者快取：每個 worker 保留最近使用的登入者資料，避免每個請求都查詢資料庫
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', '1024'))
+app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', '60'))
+# 員工與出勤記錄表格 HTML 片段快取的記憶體上限（位元組，每個 worker）
+app.config['FRAGMENT_CACHE_BYTES'] = int(os.environ.get('FRAGMENT_CACHE_BYTES', str(32 * 1024 * 1024)))
+# 工作地點網格索引的網格大小（度，0.01 約 1.1 公里）
+app.config['WORK_SITE_GRID'] = float(os.environ.get('WORK_SITE_GRID', '0.01'))
+# 打卡機上傳批次打卡用的 Bearer 權杖（以逗號分隔多組）
+app.config['PUNCH_DEVICE_TOKENS'] = [token.strip() for token in os.environ.get('PUNCH_DEVICE_TOKENS', '').split(',') if token.strip()]
+# 員工自行上傳離線打卡時可接受的最長離線時數（打卡機與管理員不受限制）
+app.config['PUNCH_MAX_OFFLINE_HOURS'] = float(os.environ.get('PUNCH_MAX_OFFLINE_HOURS', '12'))
+# /metrics 存取權杖（未設定時僅限管理員登入後查看）；慢請求取樣分析門檻（毫秒，0 為停用）與取樣間隔
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')
+# 薪資系統抓取 /export_attendance 用的 Bearer 權杖（未設定時僅限管理員登入後下載）
+app.config['EXPORT_TOKEN'] = os.environ.get('EXPORT_TOKEN', '')
+app.config['PROFILE_SLOW_REQUEST_MS'] = int(os.environ.get('PROFILE_SLOW_REQUEST_MS', '0'))
+app.config['PROFILE_SAMPLE_INTERVAL_MS'] = int(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
 
 db = SQLAlchemy(app)
 login_manager = LoginManager()
@@ -20,11 +116,21 @@ login_manager.login_view = 'login'
 
 # 資料庫模型
 class Employee(UserMixin, db.Model):
+    """登入與身分驗證所需的欄位，每個請求都會載入，保持精簡"""
     id = db.Column(db.Integer, primary_key=True)
     employee_id = db.Column(db.String(20), unique=True, nullable=False)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    is_active = db.Column(db.Boolean, default=True)
+    is_admin = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 個人資料只在編輯員工時載入
+    profile = db.relationship('EmployeeProfile', uselist=False, lazy='select', cascade='all, delete-orphan')
+
+class EmployeeProfile(db.Model):
+    """員工人事資料（地址、學經歷、家庭狀況等），與 Employee 一對一"""
+    id = db.Column(db.Integer, db.ForeignKey('employee.id'), primary_key=True)
     gender = db.Column(db.String(10))
     birth_date = db.Column(db.Date)
     marital_status = db.Column(db.String(20))
@@ -58,9 +164,6 @@ class Employee(UserMixin, db.Model):
     computer_skills = db.Column(db.Text)
     insurance_items = db.Column(db.Text)
     criminal_record = db.Column(db.Text)
-    is_active = db.Column(db.Boolean, default=True)
-    is_admin = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class AttendanceRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -75,11 +178,679 @@ class AttendanceRecord(db.Model):
     clock_out_latitude = db.Column(db.Float)
     clock_out_longitude = db.Column(db.Float)
     clock_out_address = db.Column(db.String(500))
+    # 地理圍籬判定：是否在工作地點範圍內打卡（未提供座標或未設定工作地點時為 None）
+    clock_in_site_id = db.Column(db.Integer, db.ForeignKey('work_site.id'))
+    clock_in_on_site = db.Column(db.Boolean)
+    clock_out_site_id = db.Column(db.Integer, db.ForeignKey('work_site.id'))
+    clock_out_on_site = db.Column(db.Boolean)
     employee = db.relationship('Employee', backref='attendance_records')
+    
+    __table_args__ = (
+        # 列表依 (date, id) 做 keyset 分頁
+        db.Index('ix_attendance_record_date_id', 'date', 'id'),
+        # 每位員工每天只有一筆記錄，打卡以此索引做 upsert
+        db.Index('uq_attendance_record_employee_date', 'employee_id', 'date', unique=True),
+        # 封存的記錄保留原本的 id：AUTOINCREMENT 確保搬移後 id 不會被新記錄重複使用
+        {'sqlite_autoincrement': True},
+    )
+
+class AttendanceChange(db.Model):
+    """出勤記錄變更日誌，由 SQLite 觸發器維護；每筆出勤記錄只保留最新一次變更，增量匯出以 seq 作為游標"""
+    __tablename__ = 'attendance_change'
+    seq = db.Column(db.Integer, primary_key=True)
+    record_id = db.Column(db.Integer, nullable=False, index=True)
+    employee_id = db.Column(db.Integer, nullable=False)  # 不設外鍵：員工刪除後仍保留刪除標記
+    date = db.Column(db.Date, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert / delete
+    changed_at = db.Column(db.DateTime, nullable=False)
+    
+    # AUTOINCREMENT 確保刪除最新一筆後序號不會重複使用，下游游標不會漏掉變更
+    __table_args__ = {'sqlite_autoincrement': True}
+
+class AttendanceArchive(db.Model):
+    """已封存月份的登記表：每個月份的出勤記錄搬移到一個封存資料表（attendance_record_YYYYMM），欄位與 attendance_record 相同"""
+    __tablename__ = 'attendance_archive'
+    month = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    table_name = db.Column(db.String(40), nullable=False)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class WorkSite(db.Model):
+    """工作地點：以中心點加半徑，或多邊形（JSON [[緯度, 經度], ...]）定義打卡範圍"""
+    __tablename__ = 'work_site'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    address = db.Column(db.String(500))  # 在場打卡時直接作為打卡地址，不需查詢外部服務
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    radius_m = db.Column(db.Float, nullable=False, default=100)
+    polygon = db.Column(db.Text)
+    is_active = db.Column(db.Boolean, default=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class DailyWorkSummary(db.Model):
+    """每位員工每日工時彙總，由打卡與刪除出勤記錄時即時更新"""
+    __tablename__ = 'work_hours_daily'
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    incomplete = db.Column(db.Boolean, nullable=False, default=False)  # 只有上班打卡
+
+class MonthlyWorkSummary(db.Model):
+    """每位員工每月工時彙總（月份格式 YYYY-MM）"""
+    __tablename__ = 'work_hours_monthly'
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)
+    hours = db.Column(db.Float, nullable=False, default=0.0)
+    days_present = db.Column(db.Integer, nullable=False, default=0)
+    incomplete_days = db.Column(db.Integer, nullable=False, default=0)
+
+class TableVersion(db.Model):
+    """各資料表的變更計數，由 SQLite 觸發器在每次寫入時遞增，供條件式 GET 產生 ETag"""
+    __tablename__ = 'table_version'
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime)
+
+class GeocodeCache(db.Model):
+    """座標轉地址快取，以網格為單位，供所有 worker 共用"""
+    cell_key = db.Column(db.String(64), primary_key=True)
+    address = db.Column(db.String(500), nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class PunchReceipt(db.Model):
+    """批次打卡的處理結果，以裝置產生的打卡 ID 為主鍵，裝置重送時直接回傳先前的結果"""
+    __tablename__ = 'punch_receipt'
+    punch_id = db.Column(db.String(64), primary_key=True)
+    device_id = db.Column(db.String(64))
+    employee_id = db.Column(db.Integer, db.ForeignKey('employee.id'), nullable=False, index=True)
+    punch_type = db.Column(db.String(10), nullable=False)  # clock_in / clock_out
+    punched_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(10), nullable=False)  # applied / rejected
+    message = db.Column(db.String(200))
+    record_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class PendingGeocode(db.Model):
+    """待轉換地址的打卡座標（持久化佇列，重新啟動後繼續處理）"""
+    id = db.Column(db.Integer, primary_key=True)
+    record_id = db.Column(db.Integer, db.ForeignKey('attendance_record.id'), nullable=False, index=True)
+    punch_type = db.Column(db.String(10), nullable=False)  # clock_in / clock_out
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    cell_key = db.Column(db.String(64), nullable=False, index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    claimed_by = db.Column(db.String(32))
+    claimed_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class LRUCache:
+    """執行緒安全的 LRU 快取，可設定每筆資料的有效秒數"""
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+            return item[0] if item is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+# 員工列表只需要的欄位，避免載入整列個人資料
+EMPLOYEE_LIST_COLUMNS = (
+    Employee.id,
+    Employee.employee_id,
+    Employee.name,
+    Employee.username,
+    Employee.is_active,
+    Employee.created_at
+)
+
+# 延遲直方圖的區間上限（秒，與 Prometheus client 預設相同）與每請求 SQL 數量的區間
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class MetricsRegistry:
+    """行程內的計數器與直方圖，以 Prometheus 文字格式輸出（每個 worker 各自統計）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+
+    def counter(self, name, help_text):
+        self._metrics[name] = {'type': 'counter', 'help': help_text, 'buckets': None, 'series': {}}
+
+    def histogram(self, name, help_text, buckets=METRICS_LATENCY_BUCKETS):
+        self._metrics[name] = {'type': 'histogram', 'help': help_text, 'buckets': tuple(buckets), 'series': {}}
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._metrics[name]['series']
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        metric = self._metrics[name]
+        key = tuple(sorted(labels.items()))
+        bucket = bisect.bisect_left(metric['buckets'], value)
+        with self._lock:
+            state = metric['series'].get(key)
+            if state is None:
+                # [各區間筆數（最後一格為 +Inf）, 總筆數, 總和]
+                state = metric['series'][key] = [[0] * (len(metric['buckets']) + 1), 0, 0.0]
+            state[0][bucket] += 1
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            snapshot = [
+                (name, metric, {key: (list(value[0]), value[1], value[2]) if metric['buckets'] else value
+                                for key, value in metric['series'].items()})
+                for name, metric in self._metrics.items()
+            ]
+        for name, metric, series in snapshot:
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for key, value in series.items():
+                if metric['buckets'] is None:
+                    lines.append(f'{name}{self._format_labels(key)} {value}')
+                    continue
+                counts, total, value_sum = value
+                cumulative = 0
+                for bound, count in zip(metric['buckets'] + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{self._format_labels(key + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{self._format_labels(key)} {value_sum}')
+                lines.append(f'{name}_count{self._format_labels(key)} {total}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _format_labels(key):
+        if not key:
+            return ''
+        parts = []
+        for label, value in key:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            parts.append(f'{label}="{value}"')
+        return '{' + ','.join(parts) + '}'
+
+metrics = MetricsRegistry()
+metrics.counter('http_requests_total', '各路由請求數')
+metrics.histogram('http_request_duration_seconds', '各路由請求處理時間（秒）')
+metrics.histogram('http_request_sql_statements', '每個請求執行的 SQL 陳述式數', METRICS_COUNT_BUCKETS)
+metrics.histogram('http_request_sql_seconds', '每個請求的資料庫執行時間總和（秒）')
+metrics.counter('db_statements_total', 'SQL 陳述式總數（含背景工作）')
+metrics.counter('db_seconds_total', 'SQL 陳述式執行時間總和（秒）')
+metrics.histogram('geocode_request_seconds', '外部地址查詢延遲（秒）')
+metrics.counter('geocode_errors_total', '外部地址查詢失敗次數')
+metrics.counter('geocode_circuit_open_total', '外部地址服務斷路器開啟次數')
+metrics.histogram('excel_export_seconds', 'Excel 匯出產生時間（秒）')
+metrics.counter('excel_export_rows_total', 'Excel 匯出資料列數')
+metrics.histogram('bulk_export_seconds', '大量匯出（CSV / Parquet）產生時間（秒）')
+metrics.counter('bulk_export_rows_total', '大量匯出資料列數')
+metrics.counter('slow_request_profiles_total', '已寫入的慢請求分析檔數')
+metrics.counter('fragment_cache_requests_total', '表格 HTML 片段快取命中與未命中次數')
+metrics.counter('employee_search_requests_total', '員工搜尋次數（記憶體前綴索引或全文索引）')
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info['sql_started'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_sql_time(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('sql_started', time.perf_counter())
+    metrics.inc('db_statements_total')
+    metrics.inc('db_seconds_total', elapsed)
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+        g.sql_seconds += elapsed
+
+class SamplingProfiler:
+    """取樣式分析器：背景執行緒定期以 sys._current_frames() 擷取進行中請求的呼叫堆疊，
+    請求超過門檻時以 collapsed 格式（可直接交給 flamegraph.pl / speedscope）寫入 instance/profiles"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self._pid = None
+
+    def begin(self):
+        self._ensure_started()
+        with self._lock:
+            self._active[threading.get_ident()] = {}
+
+    def end(self):
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _ensure_started(self):
+        # fork 後執行緒不會延續，依 pid 判斷是否需要重新啟動
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                thread_ids = list(self._active)
+            if not thread_ids:
+                continue
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                key = ';'.join(reversed(stack))
+                with self._lock:
+                    samples = self._active.get(thread_id)
+                    if samples is not None:
+                        samples[key] = samples.get(key, 0) + 1
+
+    def dump(self, samples, label, elapsed):
+        directory = os.path.join(app.instance_path, 'profiles')
+        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{label}_{int(elapsed * 1000)}ms_{uuid.uuid4().hex[:6]}.folded"
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, filename), 'w', encoding='utf-8') as f:
+                for stack, count in sorted(samples.items(), key=lambda item: -item[1]):
+                    f.write(f'{stack} {count}\n')
+        except OSError as e:
+            app.logger.warning(f'無法寫入請求分析檔 {filename}：{e}')
+            return
+        metrics.inc('slow_request_profiles_total', endpoint=label)
+
+request_profiler = SamplingProfiler(app.config['PROFILE_SAMPLE_INTERVAL_MS'] / 1000) if app.config['PROFILE_SLOW_REQUEST_MS'] else None
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    if request_profiler:
+        request_profiler.begin()
+
+@app.after_request
+def _record_request_metrics(response):
+    _observe_request(response.status_code)
+    return response
+
+@app.teardown_request
+def _record_failed_request_metrics(exc):
+    # 未處理的例外不會經過 after_request
+    if exc is not None:
+        _observe_request(500)
+
+def _observe_request(status_code):
+    if 'request_started' not in g or g.get('request_observed'):
+        return
+    g.request_observed = True
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unmatched'
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=str(status_code))
+    metrics.observe('http_request_duration_seconds', elapsed, endpoint=endpoint)
+    metrics.observe('http_request_sql_statements', g.sql_statements, endpoint=endpoint)
+    metrics.observe('http_request_sql_seconds', g.sql_seconds, endpoint=endpoint)
+    if request_profiler:
+        samples = request_profiler.end()
+        if samples and elapsed * 1000 >= app.config['PROFILE_SLOW_REQUEST_MS']:
+            request_profiler.dump(samples, endpoint, elapsed)
+
+# SQLite PRAGMA 值只接受下列設定，避免環境變數內容直接組進 SQL
+SQLITE_PRAGMA_CHOICES = {
+    'journal_mode': ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'),
+    'synchronous': ('OFF', 'NORMAL', 'FULL', 'EXTRA'),
+    'temp_store': ('DEFAULT', 'FILE', 'MEMORY'),
+}
+
+def _sqlite_connection_pragmas():
+    pragmas = [
+        ('busy_timeout', app.config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('journal_mode', app.config['SQLITE_JOURNAL_MODE'].upper()),
+        ('synchronous', app.config['SQLITE_SYNCHRONOUS'].upper()),
+        ('mmap_size', app.config['SQLITE_MMAP_SIZE']),
+        ('cache_size', app.config['SQLITE_CACHE_SIZE']),
+        ('temp_store', app.config['SQLITE_TEMP_STORE'].upper()),
+    ]
+    for name, value in pragmas:
+        if name in SQLITE_PRAGMA_CHOICES and value not in SQLITE_PRAGMA_CHOICES[name]:
+            raise ValueError(f'不支援的 SQLite {name} 設定：{value}')
+    return pragmas
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in _sqlite_connection_pragmas():
+            cursor.execute(f'PRAGMA {name} = {value}')
+    finally:
+        cursor.close()
+
+class CircuitBreaker:
+    """外部服務斷路器：連續失敗達門檻後暫停呼叫，冷卻時間過後只放行一個試探請求，成功才恢復"""
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._probing or time.monotonic() - self._opened_at >= self.cooldown:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    metrics.inc('geocode_circuit_open_total')
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+class ChangeStamp:
+    """以 instance 目錄中的檔案修改時間通知其他 worker 資料已變更（只需 os.stat，不查詢資料庫）"""
+
+    def __init__(self, name):
+        self.path = os.path.join(app.instance_path, f'{name}.stamp')
+        self._seen = self._read()
+
+    def _read(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def bump(self):
+        try:
+            os.makedirs(app.instance_path, exist_ok=True)
+            with open(self.path, 'w') as f:
+                f.write(uuid.uuid4().hex)
+        except OSError as e:
+            app.logger.warning(f'無法更新變更標記 {self.path}：{e}')
+        self._seen = self._read()
+
+    def changed(self):
+        """自上次檢查後是否有其他 worker 更新過標記"""
+        current = self._read()
+        if current == self._seen:
+            return False
+        self._seen = current
+        return True
+
+class SessionUser(UserMixin):
+    """快取在記憶體中的登入者資料，不綁定資料庫 session"""
+
+    def __init__(self, row):
+        self.id = row.id
+        self.employee_id = row.employee_id
+        self.username = row.username
+        self.name = row.name
+        self.is_admin = bool(row.is_admin)
+        self._is_active = bool(row.is_active)
+
+    @property
+    def is_active(self):
+        return self._is_active
+
+_user_cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+_user_cache_stamp = ChangeStamp('user_cache')
+
+def _invalidate_user_cache(*user_ids):
+    """員工資料異動後清除快取（本 worker 立即清除，其他 worker 透過變更標記得知）"""
+    for user_id in user_ids:
+        _user_cache.pop(int(user_id))
+    _user_cache_stamp.bump()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Employee.query.get(int(user_id))
+    user_id = int(user_id)
+    if _user_cache_stamp.changed():
+        _user_cache.clear()
+    
+    user = _user_cache.get(user_id)
+    if user is None:
+        row = db.session.execute(
+            select(Employee.id, Employee.employee_id, Employee.username, Employee.name,
+                   Employee.is_active, Employee.is_admin)
+            .where(Employee.id == user_id)
+        ).first()
+        # 已停用的帳號視同未登入
+        if row is None or not row.is_active:
+            return None
+        user = SessionUser(row)
+        _user_cache.set(user_id, user)
+    return user
+
+# 以資料表版本做條件式 GET：版本由 SQLite 觸發器在每次寫入時遞增，讀取只需查詢一個小資料表
+VERSIONED_TABLES = ('employee', 'attendance_record', 'work_site')
+# 程式或樣板更新後 ETag 也隨之改變（各 worker 由相同檔案計算，結果一致）
+_template_root = os.path.join(app.root_path, app.template_folder)
+_asset_version = max(
+    [os.stat(__file__).st_mtime_ns] +
+    [entry.stat().st_mtime_ns for entry in os.scandir(_template_root) if entry.is_file()]
+)
+
+def _table_versions(tables):
+    """回傳 ({資料表: 版本}, 最後修改時間)；同一請求內只查詢一次所有版本，條件式 GET 與片段快取共用"""
+    rows = g.get('table_versions') if has_request_context() else None
+    if rows is None:
+        rows = db.session.execute(
+            select(TableVersion.name, TableVersion.version, TableVersion.updated_at)
+            .where(TableVersion.name.in_(VERSIONED_TABLES))
+        ).all()
+        if has_request_context():
+            g.table_versions = rows
+    rows = [row for row in rows if row.name in tables]
+    versions = {row.name: row.version for row in rows}
+    last_modified = max((row.updated_at for row in rows if row.updated_at), default=None)
+    return versions, last_modified
+
+def conditional_get(*tables):
+    """路由裝飾器：以相關資料表版本、網址與登入者產生 ETag / Last-Modified，
+    用戶端快取仍有效時直接回應 304，不執行查詢也不產生樣板（放在 login_required 之後）"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # 有待顯示的提示訊息時必須重新產生頁面
+            if request.method != 'GET' or session.get('_flashes'):
+                return view(*args, **kwargs)
+            
+            versions, last_modified = _table_versions(tables)
+            key = repr((sorted(versions.items()), request.full_path, current_user.get_id(), _asset_version))
+            etag = hashlib.sha1(key.encode('utf-8')).hexdigest()
+            # 只以 ETag 判斷：Last-Modified 精確度只到秒，也不含網址、登入者與靜態資源版本，
+            # 只帶 If-Modified-Since 的請求可能在同一秒內的寫入或改版後誤得 304
+            if not is_resource_modified(request.environ, etag=etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # 瀏覽器可保留副本，但每次使用前都需向伺服器確認
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def _ensure_table_version_triggers():
+    """建立資料表版本列與遞增版本的觸發器（新增、修改、刪除都會遞增）"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+    
+    with db.engine.begin() as conn:
+        existing = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'table_version_%'"
+        ).scalars())
+        for table in VERSIONED_TABLES:
+            conn.exec_driver_sql(
+                "INSERT OR IGNORE INTO table_version (name, version, updated_at) VALUES (?, 1, CURRENT_TIMESTAMP)", (table,)
+            )
+            for event_name in ('INSERT', 'UPDATE', 'DELETE'):
+                trigger = f'table_version_{table}_{event_name.lower()}'
+                if trigger not in existing:
+                    conn.exec_driver_sql(f"""
+                        CREATE TRIGGER {trigger} AFTER {event_name} ON {table} BEGIN
+                            UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                            WHERE name = '{table}';
+                        END""")
+
+class FragmentCache:
+    """已產生的 HTML 片段快取，以位元組數限制記憶體用量（LRU 淘汰）。
+    鍵值包含相關資料表的版本，其他 worker 寫入後舊片段自然不再命中；本 worker 寫入時依資料表提早清除"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # 鍵值 -> (片段, 位元組數, 相關資料表)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key, value, size, tables):
+        # 單一片段超過上限的四分之一時不快取，避免一次擠掉所有片段
+        if size > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            self._data[key] = (value, size, frozenset(tables))
+            self._size += size
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._data.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, *tables):
+        """清除與指定資料表相關的片段"""
+        with self._lock:
+            for key in [key for key, item in self._data.items() if item[2].intersection(tables)]:
+                self._size -= self._data.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None,
+                'evictions': self.evictions
+            }
+
+fragment_cache = FragmentCache(app.config['FRAGMENT_CACHE_BYTES'])
+
+def _cached_fragment(name, tables, key, render):
+    """回傳 render() 產生的 (HTML 片段, 附帶資料)；相關資料表版本未變時直接使用快取，不查詢也不產生樣板"""
+    versions, _ = _table_versions(tables)
+    # 沒有版本資訊（非 SQLite）時無法得知其他 worker 的寫入，不快取
+    if not versions:
+        return render()
+    
+    cache_key = (name, key, tuple(sorted(versions.items())), _asset_version)
+    fragment = fragment_cache.get(cache_key)
+    if fragment is not None:
+        metrics.inc('fragment_cache_requests_total', fragment=name, result='hit')
+        return fragment
+    metrics.inc('fragment_cache_requests_total', fragment=name, result='miss')
+    fragment = render()
+    fragment_cache.set(cache_key, fragment, sys.getsizeof(fragment[0]), tables)
+    return fragment
 
 # 路由
 @app.route('/')
@@ -91,10 +862,26 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        employee = Employee.query.filter_by(username=username).first()
+        # 只查詢登入需要的欄位（username 有唯一索引）
+        row = db.session.execute(
+            select(Employee.id, Employee.employee_id, Employee.username, Employee.name,
+                   Employee.is_active, Employee.is_admin, Employee.password_hash)
+            .where(Employee.username == username)
+        ).first()
         
-        if employee and check_password_hash(employee.password_hash, password) and employee.is_active:
-            login_user(employee)
+        result = _verify_password(row.password_hash, password) if row else (False, None)
+        if result is None:
+            flash('目前登入人數過多，請稍後再試')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        
+        verified, new_hash = result
+        if verified and row.is_active:
+            if new_hash:
+                db.session.execute(update(Employee).where(Employee.id == row.id).values(password_hash=new_hash))
+                db.session.commit()
+            user = SessionUser(row)
+            _user_cache.set(user.id, user)
+            login_user(user)
             return redirect(url_for('dashboard'))
         else:
             flash('登入失敗，請檢查帳號密碼或帳號狀態')
@@ -114,13 +901,58 @@ def dashboard():
 
 @app.route('/employee_management')
 @login_required
+@conditional_get('employee')
 def employee_management():
     if not current_user.is_admin:
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    employees = Employee.query.filter_by(is_admin=False).all()
-    return render_template('employee_management.html', employees=employees)
+    employee_rows, _ = _cached_fragment('employee_rows', ('employee',), (), _render_employee_rows)
+    return render_template('employee_management.html', employee_rows=employee_rows)
+
+def _render_employee_rows():
+    employees = db.session.execute(
+        select(*EMPLOYEE_LIST_COLUMNS).where(Employee.is_admin == False)
+    ).all()
+    return Markup(render_template('employee_rows.html', employees=employees)), None
+
+def _employee_profile_from_form(form):
+    """從新增/編輯員工表單讀取人事資料欄位"""
+    return dict(
+        gender=form.get('gender', ''),
+        birth_date=datetime.strptime(form.get('birth_date', ''), '%Y-%m-%d').date() if form.get('birth_date') else None,
+        marital_status=form.get('marital_status', ''),
+        id_number=form.get('id_number', ''),
+        address=form.get('address', ''),
+        household_address=form.get('household_address', ''),
+        email=form.get('email', ''),
+        contact_phone=form.get('contact_phone', ''),
+        mobile_phone=form.get('mobile_phone', ''),
+        physical_condition=form.get('physical_condition', ''),
+        height=int(form.get('height', 0)) if form.get('height') else None,
+        weight=int(form.get('weight', 0)) if form.get('weight') else None,
+        special_status=form.get('special_status', ''),
+        disability_status=form.get('disability_status', ''),
+        emergency_contact_name=form.get('emergency_contact_name', ''),
+        emergency_contact_relation=form.get('emergency_contact_relation', ''),
+        emergency_contact_phone=form.get('emergency_contact_phone', ''),
+        education=form.get('education', ''),
+        work_experience=form.get('work_experience', ''),
+        family_status=form.get('family_status', ''),
+        specialty=form.get('specialty', ''),
+        hobbies=form.get('hobbies', ''),
+        insurance=form.get('insurance', ''),
+        vision=form.get('vision', ''),
+        languages=form.get('languages', ''),
+        driver_license=form.get('driver_license', ''),
+        military_service=form.get('military_service', ''),
+        military_branch=form.get('military_branch', ''),
+        certifications=form.get('certifications', ''),
+        financial_reports=form.get('financial_reports', ''),
+        computer_skills=form.get('computer_skills', ''),
+        insurance_items=form.get('insurance_items', ''),
+        criminal_record=form.get('criminal_record', '')
+    )
 
 @app.route('/add_employee', methods=['GET', 'POST'])
 @login_required
@@ -130,55 +962,20 @@ def add_employee():
         return redirect(url_for('dashboard'))
     
     if request.method == 'POST':
-        # 調試：顯示接收到的表單數據
-        print("接收到的表單數據:")
-        for key, value in request.form.items():
-            print(f"{key}: {value}")
-        
         # 處理表單資料
         try:
             employee = Employee(
                 employee_id=request.form.get('employee_id', ''),
                 username=request.form.get('username', ''),
-                password_hash=generate_password_hash(request.form.get('password', '')),
+                password_hash=generate_password_hash(request.form.get('password', ''), app.config['PASSWORD_HASH_METHOD']),
                 name=request.form.get('name', ''),
-                gender=request.form.get('gender', ''),
-                birth_date=datetime.strptime(request.form.get('birth_date', ''), '%Y-%m-%d').date() if request.form.get('birth_date') else None,
-                marital_status=request.form.get('marital_status', ''),
-                id_number=request.form.get('id_number', ''),
-                address=request.form.get('address', ''),
-                household_address=request.form.get('household_address', ''),
-                email=request.form.get('email', ''),
-                contact_phone=request.form.get('contact_phone', ''),
-                mobile_phone=request.form.get('mobile_phone', ''),
-                physical_condition=request.form.get('physical_condition', ''),
-                height=int(request.form.get('height', 0)) if request.form.get('height') else None,
-                weight=int(request.form.get('weight', 0)) if request.form.get('weight') else None,
-                special_status=request.form.get('special_status', ''),
-                disability_status=request.form.get('disability_status', ''),
-                emergency_contact_name=request.form.get('emergency_contact_name', ''),
-                emergency_contact_relation=request.form.get('emergency_contact_relation', ''),
-                emergency_contact_phone=request.form.get('emergency_contact_phone', ''),
-                education=request.form.get('education', ''),
-                work_experience=request.form.get('work_experience', ''),
-                family_status=request.form.get('family_status', ''),
-                specialty=request.form.get('specialty', ''),
-                hobbies=request.form.get('hobbies', ''),
-                insurance=request.form.get('insurance', ''),
-                vision=request.form.get('vision', ''),
-                languages=request.form.get('languages', ''),
-                driver_license=request.form.get('driver_license', ''),
-                military_service=request.form.get('military_service', ''),
-                military_branch=request.form.get('military_branch', ''),
-                certifications=request.form.get('certifications', ''),
-                financial_reports=request.form.get('financial_reports', ''),
-                computer_skills=request.form.get('computer_skills', ''),
-                insurance_items=request.form.get('insurance_items', ''),
-                criminal_record=request.form.get('criminal_record', '')
+                profile=EmployeeProfile(**_employee_profile_from_form(request.form))
             )
             
             db.session.add(employee)
             db.session.commit()
+            fragment_cache.invalidate('employee')
+            employee_search_index.upsert(employee)
             flash('員工新增成功')
             return redirect(url_for('employee_management'))
             
@@ -189,6 +986,210 @@ def add_employee():
     
     return render_template('add_employee.html')
 
+@app.route('/import_employees', methods=['GET', 'POST'])
+@login_required
+def import_employees():
+    if not current_user.is_admin:
+        if request.method == 'POST':
+            return jsonify({'success': False, 'message': '權限不足'})
+        flash('權限不足')
+        return redirect(url_for('dashboard'))
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            return jsonify({'success': False, 'message': '請選擇要匯入的檔案'})
+        if not upload.filename.lower().endswith(('.xlsx', '.csv')):
+            return jsonify({'success': False, 'message': '僅支援 .xlsx 或 .csv 檔案'})
+        
+        try:
+            report = _import_employee_rows(_iter_import_rows(upload.stream, upload.filename))
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'匯入失敗：{str(e)}'})
+        finally:
+            fragment_cache.invalidate('employee')
+            employee_search_index.invalidate()
+        if 'error' in report:
+            # 先前的批次已寫入，回傳逐列報告讓使用者修正後只匯入其餘資料
+            return jsonify({
+                'success': False,
+                'message': f"匯入中斷：{report['error']}（已匯入 {report['imported']} 名員工）",
+                **report
+            })
+        return jsonify({'success': True, **report})
+    
+    return render_template('import_employees.html', fields=IMPORT_FIELDS)
+
+@app.cli.command('import-employees')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, show_default=True, help='每批寫入的筆數')
+def import_employees_command(path, batch_size):
+    """從 xlsx/csv 檔案批次匯入員工"""
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        report = _import_employee_rows(_iter_import_rows(f, path), batch_size=batch_size)
+    employee_search_index.invalidate()
+    
+    for row_error in report['errors']:
+        click.echo(f"第 {row_error['row']} 列：{'、'.join(row_error['errors'])}")
+    click.echo(f"共 {report['total']} 列，成功匯入 {report['imported']} 名員工，"
+               f"失敗 {len(report['errors'])} 列（{time.perf_counter() - started:.1f} 秒）")
+    if 'error' in report:
+        raise click.ClickException(f"匯入中斷：{report['error']}（已匯入 {report['imported']} 名員工）")
+
+# 匯入檔案的欄位：與新增員工表單相同，第一列為標題（可使用欄位名稱或中文標題）
+IMPORT_REQUIRED_FIELDS = {'employee_id': '員工編號', 'username': '帳號', 'password': '密碼', 'name': '姓名'}
+IMPORT_FIELDS = list(IMPORT_REQUIRED_FIELDS) + [column.key for column in EmployeeProfile.__table__.columns if column.key != 'id']
+IMPORT_HEADER_ALIASES = {label: field for field, label in IMPORT_REQUIRED_FIELDS.items()}
+IMPORT_BATCH_SIZE = 1000
+
+def _iter_import_rows(stream, filename):
+    """逐列讀取 xlsx（openpyxl 唯讀模式）或 csv，產生 (列號, {欄位: 文字值})"""
+    if filename.lower().endswith('.csv'):
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    else:
+        wb = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+        reader = wb.worksheets[0].iter_rows(values_only=True)
+    
+    headers = None
+    for row_number, values in enumerate(reader, 1):
+        if headers is None:
+            headers = [IMPORT_HEADER_ALIASES.get(str(value).strip(), str(value).strip()) if value is not None else ''
+                       for value in values]
+            continue
+        if not any(value not in (None, '') for value in values):
+            continue
+        yield row_number, {header: _import_cell_text(value) for header, value in zip(headers, values) if header}
+
+def _import_cell_text(value):
+    """將儲存格內容轉為表單相同的文字格式"""
+    if value is None:
+        return ''
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+def _import_employee_rows(rows, batch_size=IMPORT_BATCH_SIZE):
+    """驗證並分批寫入員工資料，回傳 {'total', 'imported', 'errors'}；
+    每批各自 commit，中途讀檔或寫入失敗時停止並在 'error' 記錄原因，'imported' 為已 commit 的員工數"""
+    existing_employee_ids = set(db.session.execute(select(Employee.employee_id)).scalars())
+    existing_usernames = set(db.session.execute(select(Employee.username)).scalars())
+    report = {'total': 0, 'imported': 0, 'errors': []}
+    batch = []
+    
+    try:
+        for row_number, row in rows:
+            report['total'] += 1
+            errors = [f'{label}為必填' for field, label in IMPORT_REQUIRED_FIELDS.items() if not row.get(field)]
+            if row.get('employee_id') in existing_employee_ids:
+                errors.append(f"員工編號 {row['employee_id']} 已存在")
+            if row.get('username') in existing_usernames:
+                errors.append(f"帳號 {row['username']} 已存在")
+            try:
+                profile = _employee_profile_from_form(row)
+            except ValueError as e:
+                errors.append(f'資料格式錯誤：{e}')
+            
+            if errors:
+                report['errors'].append({'row': row_number, 'errors': errors})
+                continue
+            
+            existing_employee_ids.add(row['employee_id'])
+            existing_usernames.add(row['username'])
+            batch.append((row, profile))
+            if len(batch) >= batch_size:
+                report['imported'] += _insert_employee_batch(batch)
+                batch = []
+        
+        if batch:
+            report['imported'] += _insert_employee_batch(batch)
+    except Exception as e:
+        db.session.rollback()
+        report['error'] = str(e)
+    return report
+
+def _insert_employee_batch(batch):
+    """以多列 INSERT 寫入一批員工與人事資料；密碼雜湊在程序池中平行計算"""
+    password_hashes = _hash_passwords([row['password'] for row, _ in batch])
+    employee_rows = [{
+        'employee_id': row['employee_id'],
+        'username': row['username'],
+        'password_hash': password_hash,
+        'name': row['name'],
+        'is_active': True,
+        'is_admin': False,
+        'created_at': datetime.utcnow()
+    } for (row, _), password_hash in zip(batch, password_hashes)]
+    
+    inserted = db.session.execute(
+        insert(Employee.__table__).returning(Employee.__table__.c.id, Employee.__table__.c.employee_id),
+        employee_rows
+    ).all()
+    ids = {employee_code: employee_id for employee_id, employee_code in inserted}
+    db.session.execute(
+        insert(EmployeeProfile.__table__),
+        [{'id': ids[row['employee_id']], **profile} for row, profile in batch]
+    )
+    db.session.commit()
+    return len(inserted)
+
+# 密碼雜湊程序池（PBKDF2 為 CPU 密集運算，不佔用請求執行緒的 GIL）；
+# 子程序執行的函式放在 passwords.py，spawn 啟動時不會重新匯入 app.py
+_password_pool = None
+_password_pool_lock = threading.Lock()
+
+def _get_password_pool():
+    global _password_pool
+    with _password_pool_lock:
+        if _password_pool is None:
+            _password_pool = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'])
+        return _password_pool
+
+def _discard_password_pool(pool):
+    """子程序異常結束後整個程序池無法再使用：捨棄它，下次使用時重新建立"""
+    global _password_pool
+    app.logger.warning('密碼雜湊程序池的子程序異常結束，重新建立程序池並改在目前程序計算')
+    with _password_pool_lock:
+        if _password_pool is pool:
+            _password_pool = None
+    pool.shutdown(wait=False)
+
+def _hash_passwords(passwords):
+    hash_with_method = partial(hash_password, method=app.config['PASSWORD_HASH_METHOD'])
+    if len(passwords) < 2:
+        return [hash_with_method(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (app.config['PASSWORD_HASH_WORKERS'] * 4))
+    pool = _get_password_pool()
+    try:
+        return list(pool.map(hash_with_method, passwords, chunksize=chunksize))
+    except BrokenProcessPool:
+        _discard_password_pool(pool)
+        return [hash_with_method(password) for password in passwords]
+
+_password_verify_slots = threading.BoundedSemaphore(app.config['PASSWORD_VERIFY_CONCURRENCY'])
+
+def _verify_password(password_hash, password):
+    """在密碼程序池中驗證密碼，回傳 (是否正確, 需更新的新雜湊或 None)；排隊或驗證逾時回傳 None"""
+    if not _password_verify_slots.acquire(timeout=app.config['PASSWORD_VERIFY_WAIT_SECONDS']):
+        return None
+    pool = _get_password_pool()
+    try:
+        future = pool.submit(check_password, password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+        return future.result(timeout=app.config['PASSWORD_VERIFY_TIMEOUT_SECONDS'])
+    except FutureTimeoutError:
+        # 子程序卡住或程序池積壓時不在請求執行緒重算，直接請使用者稍後再試
+        future.cancel()
+        app.logger.warning('密碼驗證逾時')
+        return None
+    except BrokenProcessPool:
+        _discard_password_pool(pool)
+        return check_password(password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+    finally:
+        _password_verify_slots.release()
+
 @app.route('/edit_employee/<int:id>', methods=['GET', 'POST'])
 @login_required
 def edit_employee(id):
@@ -203,50 +1204,24 @@ def edit_employee(id):
         try:
             employee.employee_id = request.form.get('employee_id', '')
             employee.name = request.form.get('name', '')
-            employee.gender = request.form.get('gender', '')
-            employee.birth_date = datetime.strptime(request.form.get('birth_date', ''), '%Y-%m-%d').date() if request.form.get('birth_date') else None
-            employee.marital_status = request.form.get('marital_status', '')
-            employee.id_number = request.form.get('id_number', '')
-            employee.address = request.form.get('address', '')
-            employee.household_address = request.form.get('household_address', '')
-            employee.email = request.form.get('email', '')
-            employee.contact_phone = request.form.get('contact_phone', '')
-            employee.mobile_phone = request.form.get('mobile_phone', '')
-            employee.physical_condition = request.form.get('physical_condition', '')
-            employee.height = int(request.form.get('height', 0)) if request.form.get('height') else None
-            employee.weight = int(request.form.get('weight', 0)) if request.form.get('weight') else None
-            employee.special_status = request.form.get('special_status', '')
-            employee.disability_status = request.form.get('disability_status', '')
-            employee.emergency_contact_name = request.form.get('emergency_contact_name', '')
-            employee.emergency_contact_relation = request.form.get('emergency_contact_relation', '')
-            employee.emergency_contact_phone = request.form.get('emergency_contact_phone', '')
-            employee.education = request.form.get('education', '')
-            employee.work_experience = request.form.get('work_experience', '')
-            employee.family_status = request.form.get('family_status', '')
-            employee.specialty = request.form.get('specialty', '')
-            employee.hobbies = request.form.get('hobbies', '')
-            employee.insurance = request.form.get('insurance', '')
-            employee.vision = request.form.get('vision', '')
-            employee.languages = request.form.get('languages', '')
-            employee.driver_license = request.form.get('driver_license', '')
-            employee.military_service = request.form.get('military_service', '')
-            employee.military_branch = request.form.get('military_branch', '')
-            employee.certifications = request.form.get('certifications', '')
-            employee.financial_reports = request.form.get('financial_reports', '')
-            employee.computer_skills = request.form.get('computer_skills', '')
-            employee.insurance_items = request.form.get('insurance_items', '')
-            employee.criminal_record = request.form.get('criminal_record', '')
+            if employee.profile is None:
+                employee.profile = EmployeeProfile()
+            for field, value in _employee_profile_from_form(request.form).items():
+                setattr(employee.profile, field, value)
             
             db.session.commit()
+            _invalidate_user_cache(employee.id)
+            fragment_cache.invalidate('employee')
+            employee_search_index.upsert(employee)
             flash('員工資料更新成功')
             return redirect(url_for('employee_management'))
             
         except Exception as e:
             db.session.rollback()
             flash(f'員工資料更新失敗：{str(e)}')
-            return render_template('edit_employee.html', employee=employee)
+            return render_template('edit_employee.html', employee=employee, profile=employee.profile or EmployeeProfile())
     
-    return render_template('edit_employee.html', employee=employee)
+    return render_template('edit_employee.html', employee=employee, profile=employee.profile or EmployeeProfile())
 
 @app.route('/delete_employee/<int:id>')
 @login_required
@@ -255,9 +1230,14 @@ def delete_employee(id):
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    employee = Employee.query.get_or_404(id)
-    db.session.delete(employee)
+    deleted_employees, _ = _delete_employees_by_ids([id])
+    if not deleted_employees:
+        db.session.rollback()
+        abort(404)
     db.session.commit()
+    _invalidate_user_cache(id)
+    fragment_cache.invalidate('employee')
+    employee_search_index.remove(id)
     flash('員工刪除成功')
     return redirect(url_for('employee_management'))
 
@@ -268,14 +1248,19 @@ def batch_delete_employees():
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    employee_ids = request.form.getlist('employee_ids')
-    for employee_id in employee_ids:
-        employee = Employee.query.get(employee_id)
-        if employee:
-            db.session.delete(employee)
+    employee_ids = request.form.getlist('employee_ids', type=int)
+    try:
+        deleted_employees, deleted_records = _delete_employees_by_ids(employee_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'批次刪除失敗：{str(e)}')
+        return redirect(url_for('employee_management'))
     
-    db.session.commit()
-    flash(f'已刪除 {len(employee_ids)} 名員工')
+    _invalidate_user_cache(*employee_ids)
+    fragment_cache.invalidate('employee')
+    employee_search_index.remove(*employee_ids)
+    flash(f'已刪除 {deleted_employees} 名員工及 {deleted_records} 筆出勤記錄')
     return redirect(url_for('employee_management'))
 
 @app.route('/toggle_employee_status/<int:id>')
@@ -288,6 +1273,9 @@ def toggle_employee_status(id):
     employee = Employee.query.get_or_404(id)
     employee.is_active = not employee.is_active
     db.session.commit()
+    _invalidate_user_cache(employee.id)
+    fragment_cache.invalidate('employee')
+    employee_search_index.upsert(employee)
     
     status = '啟用' if employee.is_active else '停用'
     flash(f'員工 {employee.name} 已{status}')
@@ -303,60 +1291,33 @@ def clock_in():
         longitude = data.get('longitude')
         address = data.get('address')
         
-        # 如果沒有地址但有座標，嘗試獲取地址
-        if not address and latitude and longitude:
-            address = getAddressFromCoordinatesSync(latitude, longitude)
-        
-        today = date.today()
-        existing_record = AttendanceRecord.query.filter_by(
-            employee_id=current_user.id, 
-            date=today
-        ).first()
+        # 在工作地點範圍內直接使用地點地址；否則先查快取，未命中則交給背景佇列
+        site, on_site = work_site_index.classify(latitude, longitude)
+        needs_geocode = False
+        if not address and site:
+            address = site.address or site.name
+        elif not address and latitude and longitude:
+            address, needs_geocode = _resolve_punch_address(latitude, longitude)
         
-        if existing_record and existing_record.clock_in_time:
+        record_id = _punch_clock_in(current_user.id, latitude, longitude, address, site, on_site)
+        if record_id is None:
             return jsonify({'success': False, 'message': '今日已打卡上班'})
         
-        if existing_record:
-            existing_record.clock_in_time = datetime.now()
-            existing_record.clock_in_latitude = latitude
-            existing_record.clock_in_longitude = longitude
-            existing_record.clock_in_address = address
-        else:
-            record = AttendanceRecord(
-                employee_id=current_user.id,
-                date=today,
-                clock_in_time=datetime.now(),
-                clock_in_latitude=latitude,
-                clock_in_longitude=longitude,
-                clock_in_address=address
-            )
-            db.session.add(record)
-        
+        if needs_geocode:
+            _enqueue_geocode(record_id, 'clock_in', latitude, longitude)
         db.session.commit()
+        fragment_cache.invalidate('attendance_record')
+        if needs_geocode:
+            geocode_worker.notify()
         return jsonify({'success': True, 'message': '上班打卡成功'})
     
     # GET請求保持原有功能
-    today = date.today()
-    existing_record = AttendanceRecord.query.filter_by(
-        employee_id=current_user.id, 
-        date=today
-    ).first()
-    
-    if existing_record and existing_record.clock_in_time:
+    if _punch_clock_in(current_user.id) is None:
         flash('今日已打卡上班')
         return redirect(url_for('dashboard'))
     
-    if existing_record:
-        existing_record.clock_in_time = datetime.now()
-    else:
-        record = AttendanceRecord(
-            employee_id=current_user.id,
-            date=today,
-            clock_in_time=datetime.now()
-        )
-        db.session.add(record)
-    
     db.session.commit()
+    fragment_cache.invalidate('attendance_record')
     flash('上班打卡成功')
     return redirect(url_for('dashboard'))
 
@@ -370,60 +1331,577 @@ def clock_out():
         longitude = data.get('longitude')
         address = data.get('address')
         
-        # 如果沒有地址但有座標，嘗試獲取地址
-        if not address and latitude and longitude:
-            address = getAddressFromCoordinatesSync(latitude, longitude)
+        # 在工作地點範圍內直接使用地點地址；否則先查快取，未命中則交給背景佇列
+        site, on_site = work_site_index.classify(latitude, longitude)
+        needs_geocode = False
+        if not address and site:
+            address = site.address or site.name
+        elif not address and latitude and longitude:
+            address, needs_geocode = _resolve_punch_address(latitude, longitude)
         
-        today = date.today()
-        record = AttendanceRecord.query.filter_by(
-            employee_id=current_user.id, 
-            date=today
-        ).first()
-        
-        if not record or not record.clock_in_time:
-            return jsonify({'success': False, 'message': '請先打卡上班'})
+        record_id, error = _punch_clock_out(current_user.id, latitude, longitude, address, site, on_site)
+        if error:
+            return jsonify({'success': False, 'message': error})
         
-        if record.clock_out_time:
-            return jsonify({'success': False, 'message': '今日已打卡下班'})
-        
-        record.clock_out_time = datetime.now()
-        record.clock_out_latitude = latitude
-        record.clock_out_longitude = longitude
-        record.clock_out_address = address
+        if needs_geocode:
+            _enqueue_geocode(record_id, 'clock_out', latitude, longitude)
         db.session.commit()
+        fragment_cache.invalidate('attendance_record')
+        if needs_geocode:
+            geocode_worker.notify()
         
         return jsonify({'success': True, 'message': '下班打卡成功'})
     
     # GET請求保持原有功能
-    today = date.today()
-    record = AttendanceRecord.query.filter_by(
-        employee_id=current_user.id, 
-        date=today
-    ).first()
-    
-    if not record or not record.clock_in_time:
-        flash('請先打卡上班')
-        return redirect(url_for('dashboard'))
-    
-    if record.clock_out_time:
-        flash('今日已打卡下班')
+    record_id, error = _punch_clock_out(current_user.id)
+    if error:
+        flash(error)
         return redirect(url_for('dashboard'))
     
-    record.clock_out_time = datetime.now()
     db.session.commit()
+    fragment_cache.invalidate('attendance_record')
     flash('下班打卡成功')
     return redirect(url_for('dashboard'))
 
+def _punch_clock_in(employee_id, latitude=None, longitude=None, address=None, site=None, on_site=None):
+    """以單一 upsert 陳述式寫入上班打卡，回傳記錄 ID；今日已打卡上班時回傳 None（呼叫端負責 commit）"""
+    today = date.today()
+    stmt = sqlite_insert(AttendanceRecord).values(
+        employee_id=employee_id,
+        date=today,
+        clock_in_time=datetime.now(),
+        clock_in_latitude=latitude,
+        clock_in_longitude=longitude,
+        clock_in_address=address,
+        clock_in_site_id=site.id if site else None,
+        clock_in_on_site=on_site
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[AttendanceRecord.employee_id, AttendanceRecord.date],
+        set_={
+            'clock_in_time': stmt.excluded.clock_in_time,
+            'clock_in_latitude': stmt.excluded.clock_in_latitude,
+            'clock_in_longitude': stmt.excluded.clock_in_longitude,
+            'clock_in_address': stmt.excluded.clock_in_address,
+            'clock_in_site_id': stmt.excluded.clock_in_site_id,
+            'clock_in_on_site': stmt.excluded.clock_in_on_site
+        },
+        where=AttendanceRecord.clock_in_time.is_(None)
+    )
+    record_id = db.session.execute(stmt.returning(AttendanceRecord.id)).scalar()
+    if record_id is not None:
+        _refresh_work_hours([(employee_id, today)])
+    return record_id
+
+def _punch_clock_out(employee_id, latitude=None, longitude=None, address=None, site=None, on_site=None):
+    """以單一 UPDATE 寫入下班打卡，回傳 (記錄 ID, 錯誤訊息)（呼叫端負責 commit）"""
+    today = date.today()
+    stmt = (
+        update(AttendanceRecord)
+        .where(
+            AttendanceRecord.employee_id == employee_id,
+            AttendanceRecord.date == today,
+            AttendanceRecord.clock_in_time.isnot(None),
+            AttendanceRecord.clock_out_time.is_(None)
+        )
+        .values(
+            clock_out_time=datetime.now(),
+            clock_out_latitude=latitude,
+            clock_out_longitude=longitude,
+            clock_out_address=address,
+            clock_out_site_id=site.id if site else None,
+            clock_out_on_site=on_site
+        )
+        .returning(AttendanceRecord.id)
+        .execution_options(synchronize_session=False)
+    )
+    record_id = db.session.execute(stmt).scalar()
+    if record_id is not None:
+        _refresh_work_hours([(employee_id, today)])
+        return record_id, None
+    
+    # 打卡失敗時才查詢原因
+    clock_in_time = db.session.execute(
+        select(AttendanceRecord.clock_in_time).where(
+            AttendanceRecord.employee_id == employee_id,
+            AttendanceRecord.date == today
+        )
+    ).scalar()
+    return None, '請先打卡上班' if clock_in_time is None else '今日已打卡下班'
+
+# 每批打卡筆數上限，以及可接受的裝置時間誤差（打卡時間不可晚於伺服器時間加上誤差）
+BATCH_PUNCH_MAX = 500
+BATCH_PUNCH_CLOCK_SKEW = timedelta(minutes=5)
+PUNCH_FIELDS = ('time', 'latitude', 'longitude', 'address', 'site_id', 'on_site')
+
+@app.route('/api/punches/batch', methods=['POST'])
+def batch_punches():
+    # 打卡機以 Bearer 權杖上傳；已登入的管理員可上傳任何員工的打卡，一般員工只能上傳自己的
+    if _is_punch_device_request() or (current_user.is_authenticated and current_user.is_admin):
+        own_employee_code = None
+    elif current_user.is_authenticated:
+        own_employee_code = current_user.employee_id
+    else:
+        return jsonify({'success': False, 'message': '未授權'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    punches = data.get('punches')
+    if not isinstance(punches, list) or not punches:
+        return jsonify({'success': False, 'message': '請提供打卡資料'}), 400
+    if len(punches) > BATCH_PUNCH_MAX:
+        return jsonify({'success': False, 'message': f'每批最多 {BATCH_PUNCH_MAX} 筆打卡'}), 413
+    
+    device_id = str(data.get('device_id') or '')[:64] or None
+    try:
+        outcome = _apply_punch_batch(punches, device_id, own_employee_code)
+        if outcome is None:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': '打卡資料已被其他請求更新，請重新上傳'}), 409
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'批次打卡失敗：{str(e)}'}), 500
+    
+    results, queued_geocode = outcome
+    fragment_cache.invalidate('attendance_record')
+    if queued_geocode:
+        geocode_worker.notify()
+    counts = {status: sum(1 for result in results if result['status'] == status) for status in ('applied', 'rejected', 'invalid')}
+    return jsonify({'success': True, 'results': results, **counts})
+
+@app.cli.command('prune-punch-receipts')
+@click.option('--days', default=30, show_default=True, help='保留最近幾天的批次打卡處理結果')
+def prune_punch_receipts_command(days):
+    """刪除過期的批次打卡處理結果（超過保留期限的打卡 ID 重送時會重新處理）"""
+    result = db.session.execute(
+        delete(PunchReceipt).where(PunchReceipt.created_at < datetime.utcnow() - timedelta(days=days))
+    )
+    db.session.commit()
+    click.echo(f'已刪除 {result.rowcount} 筆批次打卡處理結果')
+
+def _authorization_matches(token):
+    """Authorization 標頭是否為此 Bearer 權杖；以位元組比較，標頭含非 ASCII 字元時視為不符而不是拋出 TypeError"""
+    return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+
+def _is_punch_device_request():
+    return any(_authorization_matches(allowed) for allowed in app.config['PUNCH_DEVICE_TOKENS'])
+
+def _parse_batch_punch(item, max_offline_age=None):
+    """驗證單筆打卡資料，回傳 (打卡, 錯誤訊息)；max_offline_age 限制打卡時間距今的最長時間"""
+    if not isinstance(item, dict):
+        return None, '打卡資料格式錯誤'
+    punch_id = str(item.get('id') or '').strip()
+    if not punch_id or len(punch_id) > 64:
+        return None, '缺少打卡 ID 或長度超過 64 字元'
+    if item.get('type') not in ('clock_in', 'clock_out'):
+        return None, '打卡類型必須為 clock_in 或 clock_out'
+    try:
+        timestamp = datetime.fromisoformat(str(item.get('timestamp')))
+    except ValueError:
+        return None, '打卡時間格式錯誤，請使用 ISO 8601'
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    if timestamp > datetime.now() + BATCH_PUNCH_CLOCK_SKEW:
+        return None, '打卡時間晚於伺服器時間'
+    if max_offline_age is not None and timestamp < datetime.now() - max_offline_age:
+        return None, '打卡時間超過離線上傳期限，請由管理員補登'
+    
+    latitude, longitude = item.get('latitude'), item.get('longitude')
+    try:
+        latitude = float(latitude) if latitude is not None else None
+        longitude = float(longitude) if longitude is not None else None
+    except (TypeError, ValueError):
+        return None, '座標格式錯誤'
+    if (latitude is None) != (longitude is None):
+        return None, '緯度與經度必須同時提供'
+    
+    return {
+        'id': punch_id,
+        'type': item['type'],
+        'timestamp': timestamp,
+        'employee_code': str(item.get('employee_id') or '').strip(),
+        'latitude': latitude,
+        'longitude': longitude,
+        'address': item.get('address') or None
+    }, None
+
+def _apply_punch_batch(items, device_id, own_employee_code=None):
+    """在同一個交易中套用一批打卡，員工、出勤記錄與處理結果都以集合查詢取得（呼叫端負責 commit）。
+    回傳 (各筆結果, 是否有待轉換地址)；與其他請求同時寫入發生衝突時回傳 None"""
+    results = [None] * len(items)
+    punches = []
+    # 員工自行上傳時只接受近期的離線打卡，避免補登任意日期的出勤
+    max_offline_age = timedelta(hours=app.config['PUNCH_MAX_OFFLINE_HOURS']) if own_employee_code is not None else None
+    for index, item in enumerate(items):
+        punch, error = _parse_batch_punch(item, max_offline_age)
+        if punch and own_employee_code:
+            if punch['employee_code'] not in ('', own_employee_code):
+                punch, error = None, '只能上傳自己的打卡'
+            else:
+                punch['employee_code'] = own_employee_code
+        if error:
+            results[index] = {'id': item.get('id') if isinstance(item, dict) else None, 'status': 'invalid', 'message': error}
+        else:
+            punch['index'] = index
+            punches.append(punch)
+    
+    # 已處理過的打卡 ID（裝置重送）直接回傳先前的結果
+    receipts = {}
+    for chunk in _chunked({punch['id'] for punch in punches}, BULK_DELETE_CHUNK_SIZE):
+        receipts.update((row.punch_id, row) for row in db.session.execute(
+            select(PunchReceipt.punch_id, PunchReceipt.status, PunchReceipt.message, PunchReceipt.record_id)
+            .where(PunchReceipt.punch_id.in_(chunk))
+        ))
+    employees = {}
+    for chunk in _chunked({punch['employee_code'] for punch in punches}, BULK_DELETE_CHUNK_SIZE):
+        employees.update((row.employee_id, row) for row in db.session.execute(
+            select(Employee.id, Employee.employee_id, Employee.is_active).where(Employee.employee_id.in_(chunk))
+        ))
+    
+    pending = []
+    seen = set()
+    archived_months = attendance_archives.months()
+    for punch in punches:
+        receipt = receipts.get(punch['id'])
+        employee = employees.get(punch['employee_code'])
+        if receipt:
+            results[punch['index']] = {
+                'id': punch['id'], 'status': receipt.status, 'message': receipt.message,
+                'record_id': receipt.record_id, 'replayed': True
+            }
+        elif punch['id'] in seen:
+            results[punch['index']] = {'id': punch['id'], 'status': 'invalid', 'message': '同一批次中打卡 ID 重複'}
+        elif employee is None or not employee.is_active:
+            results[punch['index']] = {'id': punch['id'], 'status': 'invalid', 'message': '找不到員工或帳號已停用'}
+        elif punch['timestamp'].strftime('%Y-%m') in archived_months:
+            results[punch['index']] = {'id': punch['id'], 'status': 'invalid', 'message': '該月份出勤記錄已封存'}
+        else:
+            seen.add(punch['id'])
+            punch['key'] = (employee.id, punch['timestamp'].date())
+            pending.append(punch)
+    
+    records = {}
+    for chunk in _chunked({punch['key'] for punch in pending}, BULK_DELETE_CHUNK_SIZE):
+        for row in db.session.execute(
+            select(AttendanceRecord.id, AttendanceRecord.employee_id, AttendanceRecord.date,
+                   AttendanceRecord.clock_in_time, AttendanceRecord.clock_out_time)
+            .where(tuple_(AttendanceRecord.employee_id, AttendanceRecord.date).in_(chunk))
+        ):
+            records[(row.employee_id, row.date)] = {
+                'id': row.id, 'clock_in_time': row.clock_in_time, 'clock_out_time': row.clock_out_time, 'changes': {}
+            }
+    
+    # 依打卡時間順序在記憶體中套用，規則與 clock_in / clock_out 路由相同
+    receipt_rows = []
+    for punch in sorted(pending, key=lambda punch: punch['timestamp']):
+        record = records.get(punch['key'])
+        punch_type = punch['type']
+        error = None
+        if punch_type == 'clock_in':
+            if record and record['clock_in_time']:
+                error = '今日已打卡上班'
+            elif record is None:
+                record = records[punch['key']] = {'id': None, 'clock_in_time': None, 'clock_out_time': None, 'changes': {}}
+        elif record is None or not record['clock_in_time']:
+            error = '請先打卡上班'
+        elif record['clock_out_time']:
+            error = '今日已打卡下班'
+        elif punch['timestamp'] < record['clock_in_time']:
+            error = '下班時間早於上班時間'
+        
+        if error is None:
+            latitude, longitude, address = punch['latitude'], punch['longitude'], punch['address']
+            site, on_site = work_site_index.classify(latitude, longitude)
+            needs_geocode = False
+            if not address and site:
+                address = site.address or site.name
+            elif not address and latitude is not None:
+                address, needs_geocode = _resolve_punch_address(latitude, longitude)
+            record[f'{punch_type}_time'] = punch['timestamp']
+            record['changes'].update({
+                f'{punch_type}_time': punch['timestamp'],
+                f'{punch_type}_latitude': latitude,
+                f'{punch_type}_longitude': longitude,
+                f'{punch_type}_address': address,
+                f'{punch_type}_site_id': site.id if site else None,
+                f'{punch_type}_on_site': on_site
+            })
+            punch['record'] = record
+            punch['needs_geocode'] = needs_geocode
+        
+        punch['status'] = 'rejected' if error else 'applied'
+        punch['message'] = error or ('上班打卡成功' if punch_type == 'clock_in' else '下班打卡成功')
+    
+    if not _write_punch_batch_records(records):
+        return None
+    
+    queued_geocode = False
+    for punch in pending:
+        record_id = punch['record']['id'] if punch['status'] == 'applied' else None
+        if punch.get('needs_geocode'):
+            _enqueue_geocode(record_id, punch['type'], punch['latitude'], punch['longitude'])
+            queued_geocode = True
+        receipt_rows.append({
+            'punch_id': punch['id'],
+            'device_id': device_id,
+            'employee_id': punch['key'][0],
+            'punch_type': punch['type'],
+            'punched_at': punch['timestamp'],
+            'status': punch['status'],
+            'message': punch['message'],
+            'record_id': record_id,
+            'created_at': datetime.utcnow()
+        })
+        results[punch['index']] = {
+            'id': punch['id'], 'status': punch['status'], 'message': punch['message'],
+            'record_id': record_id, 'replayed': False
+        }
+    
+    # 同一個打卡 ID 同時由兩個請求上傳時，只有一個能寫入處理結果
+    for chunk in _chunked(receipt_rows, BULK_DELETE_CHUNK_SIZE):
+        inserted = db.session.execute(
+            sqlite_insert(PunchReceipt.__table__).on_conflict_do_nothing().returning(PunchReceipt.__table__.c.punch_id),
+            chunk
+        ).all()
+        if len(inserted) != len(chunk):
+            return None
+    
+    _refresh_work_hours(key for key, record in records.items() if record['changes'])
+    return results, queued_geocode
+
+def _write_punch_batch_records(records):
+    """以多列 INSERT 與分組 UPDATE 寫入批次打卡的出勤記錄，並回填新記錄 ID；資料已被其他請求變更時回傳 False"""
+    table = AttendanceRecord.__table__
+    empty_punch = {f'{punch_type}_{field}': None for punch_type in ('clock_in', 'clock_out') for field in PUNCH_FIELDS}
+    new_records = {key: record for key, record in records.items() if record['id'] is None and record['changes']}
+    for chunk in _chunked(list(new_records.items()), BULK_DELETE_CHUNK_SIZE):
+        inserted = db.session.execute(
+            sqlite_insert(table).on_conflict_do_nothing()
+            .returning(table.c.id, table.c.employee_id, table.c.date),
+            [{'employee_id': employee_id, 'date': day, **empty_punch, **record['changes']}
+             for (employee_id, day), record in chunk]
+        ).all()
+        if len(inserted) != len(chunk):
+            return False
+        for record_id, employee_id, day in inserted:
+            new_records[(employee_id, day)]['id'] = record_id
+    
+    # 既有記錄依更新欄位分組，每組一個 executemany UPDATE；只更新尚未打卡的欄位
+    groups = {}
+    for key, record in records.items():
+        if key not in new_records and record['changes']:
+            groups.setdefault(tuple(sorted(record['changes'])), []).append(record)
+    for fields, group in groups.items():
+        guards = [table.c[f'{punch_type}_time'].is_(None)
+                  for punch_type in ('clock_in', 'clock_out') if f'{punch_type}_time' in fields]
+        result = db.session.execute(
+            update(table)
+            .where(table.c.id == bindparam('record_id'), *guards)
+            .values({field: bindparam(f'new_{field}') for field in fields}),
+            [{'record_id': record['id'], **{f'new_{field}': record['changes'][field] for field in fields}}
+             for record in group]
+        )
+        if result.rowcount != len(group):
+            return False
+    return True
+
 @app.route('/attendance_records')
 @login_required
+@conditional_get('attendance_record', 'employee', 'work_site')
 def attendance_records():
     if not current_user.is_admin:
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    records = AttendanceRecord.query.join(Employee).order_by(AttendanceRecord.date.desc()).all()
-    employees = Employee.query.filter_by(is_admin=False).order_by(Employee.employee_id).all()
-    return render_template('attendance_records.html', records=records, employees=employees)
+    try:
+        filters = _attendance_list_filters_from_request()
+    except ValueError:
+        flash('日期格式錯誤，請使用 YYYY-MM-DD')
+        return redirect(url_for('attendance_records'))
+    
+    limit = _page_limit_from_request()
+    record_rows, next_cursor = _cached_fragment(
+        'attendance_rows', ('attendance_record', 'employee', 'work_site'), (tuple(filters.items()), limit),
+        lambda: _render_attendance_rows(filters, limit)
+    )
+    employees = db.session.execute(
+        select(Employee.id, Employee.employee_id, Employee.name)
+        .where(Employee.is_admin == False)
+        .order_by(Employee.employee_id)
+    ).all()
+    return render_template('attendance_records.html', record_rows=record_rows, employees=employees,
+                           filters=filters, next_cursor=next_cursor)
+
+def _render_attendance_rows(filters, limit):
+    records, next_cursor = _fetch_attendance_page(filters, limit)
+    return Markup(render_template('attendance_rows.html', records=records)), next_cursor
+
+@app.route('/api/attendance_records')
+@login_required
+@conditional_get('attendance_record', 'employee', 'work_site')
+def api_attendance_records():
+    if not current_user.is_admin:
+        return jsonify({'error': '權限不足'}), 403
+    
+    try:
+        filters = _attendance_list_filters_from_request()
+        cursor = _decode_attendance_cursor(request.args.get('cursor', ''))
+    except ValueError:
+        return jsonify({'error': '查詢參數格式錯誤'}), 400
+    
+    records, next_cursor = _fetch_attendance_page(filters, _page_limit_from_request(), cursor)
+    return jsonify({
+        'records': [_attendance_row_to_dict(record) for record in records],
+        'next_cursor': next_cursor
+    })
+
+@app.route('/api/attendance_records/stats')
+@login_required
+@conditional_get('attendance_record')
+def api_attendance_record_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': '權限不足'}), 403
+    
+    try:
+        filters = _attendance_list_filters_from_request()
+    except ValueError:
+        return jsonify({'error': '查詢參數格式錯誤'}), 400
+    
+    records = _attendance_source(filters['start_date'], filters['end_date'])
+    complete = and_(records.clock_in_time.isnot(None), records.clock_out_time.isnot(None))
+    clock_in_only = and_(records.clock_in_time.isnot(None), records.clock_out_time.is_(None))
+    total, complete_count, clock_in_only_count, missing_count = db.session.execute(
+        select(
+            func.count(),
+            func.count().filter(complete),
+            func.count().filter(clock_in_only),
+            func.count().filter(records.clock_in_time.is_(None))
+        ).select_from(records).where(*_attendance_list_conditions(filters, records))
+    ).one()
+    return jsonify({
+        'total': total,
+        'complete': complete_count,
+        'clock_in_only': clock_in_only_count,
+        'missing': missing_count
+    })
+
+# 出勤記錄列表每頁筆數
+ATTENDANCE_PAGE_SIZE = 50
+ATTENDANCE_PAGE_SIZE_MAX = 200
+
+def _page_limit_from_request():
+    limit = request.args.get('limit', ATTENDANCE_PAGE_SIZE, type=int)
+    return max(1, min(limit, ATTENDANCE_PAGE_SIZE_MAX))
+
+def _attendance_list_filters_from_request():
+    """讀取列表篩選條件：員工、日期區間、狀態（complete 完整 / clock_in_only 僅上班）"""
+    start_date, end_date = _parse_date_range_args()
+    status = request.args.get('status', '')
+    return {
+        'employee_id': request.args.get('employee_id', type=int),
+        'start_date': start_date,
+        'end_date': end_date,
+        'status': status if status in ('complete', 'clock_in_only') else ''
+    }
+
+def _attendance_list_conditions(filters, model=AttendanceRecord):
+    conditions = _attendance_filter_conditions(filters['employee_id'], filters['start_date'], filters['end_date'], model=model)
+    if filters['status'] == 'complete':
+        conditions += [model.clock_in_time.isnot(None), model.clock_out_time.isnot(None)]
+    elif filters['status'] == 'clock_in_only':
+        conditions += [model.clock_in_time.isnot(None), model.clock_out_time.is_(None)]
+    return conditions
+
+def _decode_attendance_cursor(cursor):
+    """游標格式為「日期:記錄ID」，代表上一頁最後一筆"""
+    if not cursor:
+        return None
+    cursor_date, cursor_id = cursor.split(':', 1)
+    return datetime.strptime(cursor_date, '%Y-%m-%d').date(), int(cursor_id)
+
+def _fetch_attendance_page(filters, limit, cursor=None):
+    """依 (date, id) 由新到舊做 keyset 分頁，回傳 (記錄列, 下一頁游標)"""
+    def page_conditions(model):
+        conditions = _attendance_list_conditions(filters, model)
+        if cursor:
+            conditions.append(tuple_(model.date, model.id) < tuple_(*cursor))
+        return conditions
+    
+    partitions = attendance_archives.partitions(filters['start_date'], filters['end_date'])
+    records = AttendanceRecord
+    if len(partitions) > 1:
+        # 涉及封存月份時，每個分區先依 (date, id) 索引各取前 limit + 1 筆再合併排序，不需掃描整個封存資料表
+        records = _union_attendance_partitions(
+            select(
+                select(partition).where(*page_conditions(partition))
+                .order_by(partition.date.desc(), partition.id.desc())
+                .limit(limit + 1)
+                .subquery()
+            )
+            for partition in partitions
+        )
+    
+    clock_in_site = aliased(WorkSite)
+    clock_out_site = aliased(WorkSite)
+    stmt = (
+        select(
+            records.id,
+            records.date,
+            records.clock_in_time,
+            records.clock_in_latitude,
+            records.clock_in_longitude,
+            records.clock_in_address,
+            records.clock_out_time,
+            records.clock_out_latitude,
+            records.clock_out_longitude,
+            records.clock_out_address,
+            records.clock_in_on_site,
+            records.clock_out_on_site,
+            clock_in_site.name.label('clock_in_site_name'),
+            clock_out_site.name.label('clock_out_site_name'),
+            Employee.employee_id.label('employee_code'),
+            Employee.name.label('employee_name')
+        )
+        .join(Employee, records.employee_id == Employee.id)
+        .outerjoin(clock_in_site, records.clock_in_site_id == clock_in_site.id)
+        .outerjoin(clock_out_site, records.clock_out_site_id == clock_out_site.id)
+        .where(*page_conditions(records))
+        .order_by(records.date.desc(), records.id.desc())
+        .limit(limit + 1)
+    )
+    
+    records = db.session.execute(stmt).all()
+    next_cursor = None
+    if len(records) > limit:
+        records = records[:limit]
+        last = records[-1]
+        next_cursor = f"{last.date.strftime('%Y-%m-%d')}:{last.id}"
+    return records, next_cursor
+
+def _attendance_row_to_dict(record):
+    if record.clock_in_time and record.clock_out_time:
+        work_hours = round((record.clock_out_time - record.clock_in_time).total_seconds() / 3600, 2)
+    else:
+        work_hours = None
+    return {
+        'id': record.id,
+        'employee_id': record.employee_code,
+        'employee_name': record.employee_name,
+        'date': record.date.strftime('%Y-%m-%d'),
+        'clock_in_time': record.clock_in_time.strftime('%H:%M:%S') if record.clock_in_time else None,
+        'clock_in_latitude': record.clock_in_latitude,
+        'clock_in_longitude': record.clock_in_longitude,
+        'clock_in_address': record.clock_in_address,
+        'clock_out_time': record.clock_out_time.strftime('%H:%M:%S') if record.clock_out_time else None,
+        'clock_out_latitude': record.clock_out_latitude,
+        'clock_out_longitude': record.clock_out_longitude,
+        'clock_out_address': record.clock_out_address,
+        'clock_in_on_site': record.clock_in_on_site,
+        'clock_out_on_site': record.clock_out_on_site,
+        'clock_in_site_name': record.clock_in_site_name,
+        'clock_out_site_name': record.clock_out_site_name,
+        'work_hours': work_hours
+    }
 
 @app.route('/export_attendance_excel')
 @login_required
@@ -432,8 +1910,14 @@ def export_attendance_excel():
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    records = AttendanceRecord.query.join(Employee).order_by(AttendanceRecord.date.desc()).all()
-    return _generate_excel_file(records, "所有員工出勤記錄")
+    try:
+        start_date, end_date = _parse_date_range_args()
+    except ValueError:
+        flash('日期格式錯誤，請使用 YYYY-MM-DD')
+        return redirect(url_for('attendance_records'))
+    
+    employee_id = request.args.get('employee_id', type=int)
+    return _generate_excel_file("所有員工出勤記錄", employee_id=employee_id, start_date=start_date, end_date=end_date)
 
 @app.route('/export_attendance_excel/<int:employee_id>')
 @login_required
@@ -442,65 +1926,131 @@ def export_attendance_excel_employee(employee_id):
         flash('權限不足')
         return redirect(url_for('dashboard'))
     
-    employee = Employee.query.get_or_404(employee_id)
-    records = AttendanceRecord.query.filter_by(employee_id=employee_id).order_by(AttendanceRecord.date.desc()).all()
-    return _generate_excel_file(records, f"{employee.name}出勤記錄")
-
-def _generate_excel_file(records, filename_prefix):
-    # 建立Excel檔案
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "出勤記錄"
+    try:
+        start_date, end_date = _parse_date_range_args()
+    except ValueError:
+        flash('日期格式錯誤，請使用 YYYY-MM-DD')
+        return redirect(url_for('attendance_records'))
+    
+    employee_name = db.session.execute(
+        select(Employee.name).where(Employee.id == employee_id)
+    ).scalar_one_or_none()
+    if employee_name is None:
+        abort(404)
+    return _generate_excel_file(f"{employee_name}出勤記錄", employee_id=employee_id, start_date=start_date, end_date=end_date)
+
+def _parse_date_range_args():
+    """讀取查詢參數中的 start_date / end_date（YYYY-MM-DD），格式錯誤時拋出 ValueError"""
+    return tuple(_parse_date_value(request.args.get(name, '').strip()) for name in ('start_date', 'end_date'))
+
+def _attendance_filter_conditions(employee_id=None, start_date=None, end_date=None, model=AttendanceRecord):
+    """出勤記錄查詢共用的篩選條件（model 可為任何具有 employee_id 與 date 欄位的模型）"""
+    conditions = []
+    if employee_id:
+        conditions.append(model.employee_id == employee_id)
+    if start_date:
+        conditions.append(model.date >= start_date)
+    if end_date:
+        conditions.append(model.date <= end_date)
+    return conditions
+
+# 匯出欄位：標題與固定寬度欄位的內容長度（日期 10、時間 8、工時與狀態為短字串）
+EXCEL_EXPORT_HEADERS = ['員工編號', '員工姓名', '日期', '上班時間', '上班位置', '下班時間', '下班位置', '工作時數', '狀態']
+EXCEL_EXPORT_BATCH_SIZE = 1000
+
+def _excel_column_widths(records, conditions):
+    """以 SQL 彙總計算各欄最大長度，不需在記憶體中走訪所有儲存格"""
+    lengths = db.session.execute(
+        select(
+            func.max(func.length(Employee.employee_id)),
+            func.max(func.length(Employee.name)),
+            func.max(func.length(records.clock_in_address)),
+            func.max(func.length(records.clock_out_address))
+        )
+        .select_from(records)
+        .join(Employee, records.employee_id == Employee.id)
+        .where(*conditions)
+    ).one()
+    employee_code_len, name_len, in_address_len, out_address_len = lengths
+    data_lengths = [employee_code_len or 0, name_len or 0, 10, 8, in_address_len or 0, 8, out_address_len or 0, 6, 2]
+    return [min(max(len(header), length) + 2, 50) for header, length in zip(EXCEL_EXPORT_HEADERS, data_lengths)]
+
+def _generate_excel_file(filename_prefix, employee_id=None, start_date=None, end_date=None):
+    started = time.perf_counter()
+    scope = 'employee' if employee_id else 'all'
+    # 日期範圍涉及封存月份時一併匯出封存資料表
+    records = _attendance_source(start_date, end_date)
+    conditions = _attendance_filter_conditions(employee_id, start_date, end_date, model=records)
+    
+    # 建立唯寫模式的Excel檔案，資料列直接寫入暫存檔，記憶體用量固定
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("出勤記錄")
+    
+    # 調整欄寬（唯寫模式必須在寫入資料前設定）
+    for col, width in enumerate(_excel_column_widths(records, conditions), 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
     
     # 標題列
-    headers = ['員工編號', '員工姓名', '日期', '上班時間', '上班位置', '下班時間', '下班位置', '工作時數', '狀態']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col, value=header)
+    header_cells = []
+    for header in EXCEL_EXPORT_HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
         cell.font = Font(bold=True)
         cell.alignment = Alignment(horizontal='center')
+        header_cells.append(cell)
+    ws.append(header_cells)
     
-    # 資料列
-    for row, record in enumerate(records, 2):
-        ws.cell(row=row, column=1, value=record.employee.employee_id)
-        ws.cell(row=row, column=2, value=record.employee.name)
-        ws.cell(row=row, column=3, value=record.date.strftime('%Y-%m-%d'))
-        ws.cell(row=row, column=4, value=record.clock_in_time.strftime('%H:%M:%S') if record.clock_in_time else '')
-        ws.cell(row=row, column=5, value=record.clock_in_address if record.clock_in_address else '')
-        ws.cell(row=row, column=6, value=record.clock_out_time.strftime('%H:%M:%S') if record.clock_out_time else '')
-        ws.cell(row=row, column=7, value=record.clock_out_address if record.clock_out_address else '')
-        
+    # 資料列：只查詢需要的欄位，分批讀取
+    stmt = (
+        select(
+            Employee.employee_id.label('employee_code'),
+            Employee.name,
+            records.date,
+            records.clock_in_time,
+            records.clock_in_address,
+            records.clock_out_time,
+            records.clock_out_address
+        )
+        .join(Employee, records.employee_id == Employee.id)
+        .where(*conditions)
+        .order_by(records.date.desc(), records.id.desc())
+        .execution_options(yield_per=EXCEL_EXPORT_BATCH_SIZE)
+    )
+    row_count = 0
+    for record in db.session.execute(stmt):
+        row_count += 1
         # 計算工作時數
         if record.clock_in_time and record.clock_out_time:
             work_hours = (record.clock_out_time - record.clock_in_time).total_seconds() / 3600
-            ws.cell(row=row, column=8, value=f"{work_hours:.2f}")
+            work_hours_text = f"{work_hours:.2f}"
         else:
-            ws.cell(row=row, column=8, value='')
+            work_hours_text = ''
         
         # 狀態
         if record.clock_in_time and record.clock_out_time:
-            ws.cell(row=row, column=9, value='完整')
+            status = '完整'
         elif record.clock_in_time:
-            ws.cell(row=row, column=9, value='僅上班')
+            status = '僅上班'
         else:
-            ws.cell(row=row, column=9, value='未打卡')
+            status = '未打卡'
+        
+        ws.append([
+            record.employee_code,
+            record.name,
+            record.date.strftime('%Y-%m-%d'),
+            record.clock_in_time.strftime('%H:%M:%S') if record.clock_in_time else '',
+            record.clock_in_address if record.clock_in_address else '',
+            record.clock_out_time.strftime('%H:%M:%S') if record.clock_out_time else '',
+            record.clock_out_address if record.clock_out_address else '',
+            work_hours_text,
+            status
+        ])
     
-    # 調整欄寬
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 儲存到記憶體
-    excel_file = BytesIO()
+    # 儲存到暫存檔，回應時分段傳送
+    excel_file = tempfile.TemporaryFile()
     wb.save(excel_file)
     excel_file.seek(0)
+    metrics.observe('excel_export_seconds', time.perf_counter() - started, scope=scope)
+    metrics.inc('excel_export_rows_total', row_count, scope=scope)
     
     return send_file(
         excel_file,
@@ -509,33 +2059,529 @@ def _generate_excel_file(records, filename_prefix):
         download_name=f'{filename_prefix}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
     )
 
+@app.route('/export_attendance')
+def export_attendance():
+    """大量匯出出勤記錄（CSV 串流或 Parquet）；指定 since 游標時只匯出之後新增、修改或刪除的記錄"""
+    # 薪資系統以 Bearer 權杖抓取；管理員登入後也可直接下載
+    token = app.config['EXPORT_TOKEN']
+    authorized = current_user.is_authenticated and current_user.is_admin
+    if not authorized and token:
+        authorized = _authorization_matches(token)
+    if not authorized:
+        abort(401 if token else 403)
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'parquet'):
+        return jsonify({'success': False, 'message': '匯出格式必須為 csv 或 parquet'}), 400
+    try:
+        start_date, end_date = _parse_date_range_args()
+        since, limit = (int(request.args[name]) if request.args.get(name) else None for name in ('since', 'limit'))
+    except ValueError:
+        return jsonify({'success': False, 'message': '日期或游標格式錯誤'}), 400
+    if since is not None and not _attendance_change_log_available:
+        return jsonify({'success': False, 'message': '此資料庫未啟用變更記錄，無法增量匯出'}), 400
+    
+    conditions = {'employee_id': request.args.get('employee_id', type=int), 'start_date': start_date, 'end_date': end_date}
+    stmt, next_cursor = _bulk_export_statement(conditions, since, limit)
+    filename = f'attendance_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{export_format}'
+    headers = {'X-Next-Cursor': str(next_cursor)}
+    
+    if export_format == 'parquet':
+        started = time.perf_counter()
+        parquet_file = tempfile.TemporaryFile()
+        try:
+            row_count = _write_attendance_parquet(stmt, parquet_file)
+        except ImportError:
+            parquet_file.close()
+            return jsonify({'success': False, 'message': 'Parquet 匯出需要安裝選用套件 pyarrow（pip install pyarrow）'}), 501
+        parquet_file.seek(0)
+        metrics.observe('bulk_export_seconds', time.perf_counter() - started, format='parquet')
+        metrics.inc('bulk_export_rows_total', row_count, format='parquet')
+        response = send_file(parquet_file, mimetype='application/vnd.apache.parquet', as_attachment=True, download_name=filename)
+        response.headers.update(headers)
+        return response
+    
+    return Response(
+        stream_with_context(_iter_attendance_csv(stmt)),
+        mimetype='text/csv; charset=utf-8',
+        headers={**headers, 'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.cli.command('prune-attendance-changes')
+@click.option('--days', default=90, show_default=True, help='保留最近幾天的刪除記錄')
+def prune_attendance_changes_command(days):
+    """刪除過期的出勤記錄刪除標記（游標早於保留期限的下游系統需重新全量匯出）"""
+    result = db.session.execute(
+        delete(AttendanceChange).where(
+            AttendanceChange.op == 'delete',
+            AttendanceChange.changed_at < datetime.utcnow() - timedelta(days=days)
+        )
+    )
+    db.session.commit()
+    click.echo(f'已刪除 {result.rowcount} 筆刪除標記')
+
+# 大量匯出欄位（op 為 upsert 或 delete；刪除標記只有記錄 ID、員工與日期）
+BULK_EXPORT_COLUMNS = (
+    'op', 'record_id', 'employee_code', 'employee_name', 'date',
+    'clock_in_time', 'clock_in_latitude', 'clock_in_longitude', 'clock_in_address', 'clock_in_on_site',
+    'clock_out_time', 'clock_out_latitude', 'clock_out_longitude', 'clock_out_address', 'clock_out_on_site',
+    'work_hours'
+)
+BULK_EXPORT_BATCH_SIZE = 5000
+
+def _bulk_export_statement(filters, since=None, limit=None):
+    """回傳 (匯出查詢, 下一個游標)。未指定 since 時匯出所有現有記錄，游標為目前最新的變更序號；
+    指定 since 時依變更序號匯出之後的變更（limit 限制一次取得的變更筆數；封存資料表不會再變更，只需查詢現行資料表）"""
+    records = _attendance_source(filters['start_date'], filters['end_date']) if since is None else AttendanceRecord
+    record_columns = [
+        Employee.employee_id.label('employee_code'),
+        Employee.name.label('employee_name'),
+        records.clock_in_time,
+        records.clock_in_latitude,
+        records.clock_in_longitude,
+        records.clock_in_address,
+        records.clock_in_on_site,
+        records.clock_out_time,
+        records.clock_out_latitude,
+        records.clock_out_longitude,
+        records.clock_out_address,
+        records.clock_out_on_site
+    ]
+    
+    if since is None:
+        # 先取得游標再讀取資料：期間寫入的記錄可能同時出現在本次與下次增量匯出，下游以 record_id 覆寫即可
+        next_cursor = 0
+        if _attendance_change_log_available:
+            next_cursor = db.session.execute(select(func.max(AttendanceChange.seq))).scalar() or 0
+        stmt = (
+            select(literal_column("'upsert'").label('op'), records.id.label('record_id'), records.date, *record_columns)
+            .join(Employee, records.employee_id == Employee.id)
+            .where(*_attendance_filter_conditions(filters['employee_id'], filters['start_date'], filters['end_date'], model=records))
+            .order_by(records.id)
+        )
+        return stmt, next_cursor
+    
+    window = select(AttendanceChange.seq).where(AttendanceChange.seq > since).order_by(AttendanceChange.seq)
+    if limit:
+        window = window.limit(limit)
+    next_cursor = db.session.execute(select(func.max(window.subquery().c.seq))).scalar() or since
+    stmt = (
+        select(AttendanceChange.op, AttendanceChange.record_id, AttendanceChange.date, *record_columns)
+        .select_from(AttendanceChange)
+        .outerjoin(AttendanceRecord, and_(AttendanceRecord.id == AttendanceChange.record_id, AttendanceChange.op == 'upsert'))
+        .outerjoin(Employee, Employee.id == AttendanceChange.employee_id)
+        .where(
+            AttendanceChange.seq > since,
+            AttendanceChange.seq <= next_cursor,
+            *_attendance_filter_conditions(filters['employee_id'], filters['start_date'], filters['end_date'], model=AttendanceChange)
+        )
+        .order_by(AttendanceChange.seq)
+    )
+    return stmt, next_cursor
+
+def _bulk_export_values(row):
+    """查詢結果轉為匯出欄位順序的值（工作時數在此計算）"""
+    work_hours = None
+    if row.clock_in_time and row.clock_out_time:
+        work_hours = round((row.clock_out_time - row.clock_in_time).total_seconds() / 3600, 4)
+    return tuple(row._mapping[name] for name in BULK_EXPORT_COLUMNS[:-1]) + (work_hours,)
+
+def _iter_attendance_csv(stmt):
+    """逐批讀取並輸出 CSV，每批只保留一段文字在記憶體中"""
+    started = time.perf_counter()
+    row_count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(BULK_EXPORT_COLUMNS)
+    for rows in db.session.execute(stmt.execution_options(yield_per=BULK_EXPORT_BATCH_SIZE)).partitions():
+        writer.writerows(_bulk_export_values(row) for row in rows)
+        row_count += len(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+    metrics.observe('bulk_export_seconds', time.perf_counter() - started, format='csv')
+    metrics.inc('bulk_export_rows_total', row_count, format='csv')
+
+def _write_attendance_parquet(stmt, output):
+    """以欄式 Parquet 寫入匯出資料，每批一個 row group，回傳資料列數；未安裝 pyarrow 時拋出 ImportError"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    
+    schema = pa.schema([
+        ('op', pa.string()),
+        ('record_id', pa.int64()),
+        ('employee_code', pa.string()),
+        ('employee_name', pa.string()),
+        ('date', pa.date32()),
+        ('clock_in_time', pa.timestamp('s')),
+        ('clock_in_latitude', pa.float64()),
+        ('clock_in_longitude', pa.float64()),
+        ('clock_in_address', pa.string()),
+        ('clock_in_on_site', pa.bool_()),
+        ('clock_out_time', pa.timestamp('s')),
+        ('clock_out_latitude', pa.float64()),
+        ('clock_out_longitude', pa.float64()),
+        ('clock_out_address', pa.string()),
+        ('clock_out_on_site', pa.bool_()),
+        ('work_hours', pa.float64()),
+    ])
+    row_count = 0
+    with pq.ParquetWriter(output, schema, compression='zstd') as writer:
+        for rows in db.session.execute(stmt.execution_options(yield_per=BULK_EXPORT_BATCH_SIZE)).partitions():
+            columns = zip(*(_bulk_export_values(row) for row in rows))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+            ))
+            row_count += len(rows)
+    return row_count
+
+# 出勤記錄變更日誌的觸發器：每筆出勤記錄只保留最新一筆變更（先刪除舊的再插入），
+# 員工編號或姓名變更時該員工的所有記錄都視為已修改
+ATTENDANCE_CHANGE_TRIGGERS = {
+    'attendance_change_ai': """
+        CREATE TRIGGER attendance_change_ai AFTER INSERT ON attendance_record BEGIN
+            DELETE FROM attendance_change WHERE record_id = new.id;
+            INSERT INTO attendance_change (record_id, employee_id, date, op, changed_at)
+            VALUES (new.id, new.employee_id, new.date, 'upsert', CURRENT_TIMESTAMP);
+        END""",
+    'attendance_change_au': """
+        CREATE TRIGGER attendance_change_au AFTER UPDATE ON attendance_record BEGIN
+            DELETE FROM attendance_change WHERE record_id = new.id;
+            INSERT INTO attendance_change (record_id, employee_id, date, op, changed_at)
+            VALUES (new.id, new.employee_id, new.date, 'upsert', CURRENT_TIMESTAMP);
+        END""",
+    'attendance_change_ad': """
+        CREATE TRIGGER attendance_change_ad AFTER DELETE ON attendance_record BEGIN
+            DELETE FROM attendance_change WHERE record_id = old.id;
+            INSERT INTO attendance_change (record_id, employee_id, date, op, changed_at)
+            VALUES (old.id, old.employee_id, old.date, 'delete', CURRENT_TIMESTAMP);
+        END""",
+    'attendance_change_employee_au': """
+        CREATE TRIGGER attendance_change_employee_au AFTER UPDATE OF employee_id, name ON employee
+        WHEN old.employee_id IS NOT new.employee_id OR old.name IS NOT new.name BEGIN
+            DELETE FROM attendance_change WHERE record_id IN (SELECT id FROM attendance_record WHERE employee_id = new.id);
+            INSERT INTO attendance_change (record_id, employee_id, date, op, changed_at)
+            SELECT id, employee_id, date, 'upsert', CURRENT_TIMESTAMP FROM attendance_record WHERE employee_id = new.id;
+        END""",
+}
+_attendance_change_log_available = False
+
+def _ensure_attendance_change_log():
+    """建立出勤記錄變更日誌的觸發器；觸發器不存在時（新建或資料表重建後）將尚未記錄的出勤記錄補進日誌"""
+    global _attendance_change_log_available
+    if db.engine.dialect.name != 'sqlite':
+        return
+    
+    with db.engine.begin() as conn:
+        existing = set(conn.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'attendance_change_%'"
+        ).scalars())
+        missing = [name for name in ATTENDANCE_CHANGE_TRIGGERS if name not in existing]
+        for name in missing:
+            conn.exec_driver_sql(ATTENDANCE_CHANGE_TRIGGERS[name])
+        if missing:
+            conn.exec_driver_sql("""
+                INSERT INTO attendance_change (record_id, employee_id, date, op, changed_at)
+                SELECT id, employee_id, date, 'upsert', CURRENT_TIMESTAMP FROM attendance_record
+                WHERE id NOT IN (SELECT record_id FROM attendance_change)
+                ORDER BY id
+            """)
+    _attendance_change_log_available = True
+
 @app.route('/search_employees')
 @login_required
+@conditional_get('employee')
 def search_employees():
     if not current_user.is_admin:
         return jsonify({'error': '權限不足'})
     
-    query = request.args.get('q', '')
-    if query:
-        employees = Employee.query.filter(
-            Employee.name.contains(query) | 
-            Employee.employee_id.contains(query) |
-            Employee.username.contains(query)
-        ).filter_by(is_admin=False).all()
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', EMPLOYEE_SEARCH_LIMIT, type=int), EMPLOYEE_SEARCH_LIMIT_MAX))
+    offset = max(0, request.args.get('cursor', 0, type=int))
+    
+    results, prefix_matches = employee_search_index.search(query, limit + 1, offset)
+    if query and prefix_matches is not None and len(results) <= limit:
+        # 前綴相符的員工不足一頁時，接著以全文索引補上編號、帳號、姓名中間相符的員工
+        metrics.inc('employee_search_requests_total', source='fulltext')
+        stmt = _employee_search_statement(query)
+        if prefix_matches:
+            # 前綴相符的 id 以單一 JSON 參數傳入、由 json_each 展開成子查詢，不會每個 id 各佔一個參數；
+            # 前綴比對含姓名後綴與拼音，無法以 SQL 條件重現，因此直接排除索引找到的 id
+            matched = func.json_each(json.dumps(sorted(prefix_matches))).table_valued('value')
+            stmt = stmt.where(Employee.id.notin_(select(matched.c.value)))
+        stmt = stmt.limit(limit + 1 - len(results)).offset(max(0, offset - len(prefix_matches)))
+        for emp in db.session.execute(stmt):
+            results.append({
+                'id': emp.id,
+                'employee_id': emp.employee_id,
+                'name': emp.name,
+                'username': emp.username,
+                'is_active': emp.is_active
+            })
     else:
-        employees = Employee.query.filter_by(is_admin=False).all()
-    
-    results = []
-    for emp in employees:
-        results.append({
-            'id': emp.id,
-            'employee_id': emp.employee_id,
-            'name': emp.name,
-            'username': emp.username,
-            'is_active': emp.is_active
-        })
+        metrics.inc('employee_search_requests_total', source='index')
     
-    return jsonify(results)
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = offset + limit
+    return jsonify({'employees': results, 'next_cursor': next_cursor})
+
+# 員工搜尋每次回傳的筆數
+EMPLOYEE_SEARCH_LIMIT = 20
+EMPLOYEE_SEARCH_LIMIT_MAX = 100
+
+# 員工全文索引（FTS5 trigram，可比對中文姓名中的任意連續三個字元）
+employee_fts = sql_table('employee_fts', sql_column('rowid'), sql_column('rank'))
+_employee_fts_available = False
+
+def _employee_search_statement(query):
+    """依搜尋字串建立排序後的員工查詢：三個字元以上使用全文索引，較短的字串以前綴優先排序"""
+    stmt = select(*EMPLOYEE_LIST_COLUMNS).where(Employee.is_admin == False)
+    if not query:
+        return stmt.order_by(Employee.employee_id)
+    
+    if _employee_fts_available and len(query) >= 3:
+        phrase = '"' + query.replace('"', '""') + '"'
+        return (
+            stmt.join(employee_fts, employee_fts.c.rowid == Employee.id)
+            .where(literal_column('employee_fts').op('MATCH')(phrase))
+            .order_by(employee_fts.c.rank, Employee.id)
+        )
+    
+    # trigram 無法索引少於三個字元的字串，改用 LIKE 並讓完全相符、前綴相符排在前面
+    columns = (Employee.name, Employee.employee_id, Employee.username)
+    relevance = case(
+        (or_(*(column == query for column in columns)), 0),
+        (or_(*(column.startswith(query, autoescape=True) for column in columns)), 1),
+        else_=2
+    )
+    return (
+        stmt.where(or_(*(column.contains(query, autoescape=True) for column in columns)))
+        .order_by(relevance, Employee.employee_id)
+    )
+
+# 注音的聲調符號（搜尋時不需輸入聲調）
+ZHUYIN_TONES = str.maketrans('', '', 'ˉˊˇˋ˙')
+
+def _normalize_search_text(text):
+    """搜尋鍵與查詢字串一律去除空白並轉小寫"""
+    return ''.join((text or '').split()).casefold()
+
+def _name_suffixes(name):
+    """姓名從每個中文字或每個英文單字開始的後綴，可略過姓氏直接輸入名字"""
+    name = name or ''
+    return [
+        _normalize_search_text(name[i:]) for i, char in enumerate(name)
+        if not char.isspace() and (not char.isascii() or i == 0 or name[i - 1].isspace())
+    ]
+
+def _name_romanizer():
+    """回傳將姓名轉為 [全拼, 拼音首字母, 注音] 的函式；未安裝 pypinyin 時回傳 None"""
+    try:
+        from pypinyin import Style, lazy_pinyin
+    except ImportError:
+        return None
+
+    def romanize(name):
+        syllables = lazy_pinyin(name, errors='ignore')
+        zhuyin = lazy_pinyin(name, style=Style.BOPOMOFO, errors='ignore')
+        return [''.join(syllables), ''.join(syllable[0] for syllable in syllables if syllable),
+                ''.join(zhuyin).translate(ZHUYIN_TONES)]
+    return romanize
+
+class EmployeeSearchIndex:
+    """員工搜尋的記憶體前綴索引：員工編號、帳號、姓名（含從名字開始的後綴）與拼音、注音
+    全部正規化後排序，查詢時以 bisect 找到前綴範圍的起點，依序取出前 N 名員工，不需查詢資料庫。
+    本 worker 的新增、修改、刪除直接更新索引，其他 worker 透過變更標記得知後重建"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = None        # 已排序的 (搜尋鍵, 員工編號, id)
+        self._codes = None       # 已排序的 (員工編號, id)，空白查詢依員工編號列出
+        self._employees = None   # id -> (回應資料, 該員工的搜尋鍵)
+        self._romanize = None
+        self._stamp = ChangeStamp('employee_search')
+
+    def search(self, query, limit, offset=0):
+        """回傳 (依相關性排序、略過 offset 名後的最多 limit 名員工資料, 所有前綴相符的員工 id)；
+        已取滿 limit 名時不再往下掃描，第二個值為 None"""
+        prefix = _normalize_search_text(query)
+        # 載入與查詢在同一次取得鎖的期間完成，其他執行緒的重建或寫入不會在中途替換索引
+        with self._lock:
+            self._ensure_loaded()
+            if not prefix:
+                return [self._employees[pk][0] for _, pk in self._codes[offset:offset + limit]], None
+
+            # 搜尋鍵依字典順序排列：完全相符的鍵排在最前面，其後為較長的鍵
+            keys = self._keys
+            results, seen = [], set()
+            for i in range(bisect.bisect_left(keys, (prefix,)), len(keys)):
+                key, _, pk = keys[i]
+                if not key.startswith(prefix):
+                    break
+                if pk in seen:
+                    continue
+                if len(results) >= limit:
+                    return results, None
+                seen.add(pk)
+                if len(seen) > offset:
+                    results.append(self._employees[pk][0])
+            return results, seen
+
+    def upsert(self, employee):
+        """新增或修改員工後更新索引（管理員帳號不列入搜尋）"""
+        with self._lock:
+            if self._keys is not None and not self._stamp.changed():
+                self._remove(employee.id)
+                if not employee.is_admin:
+                    self._add(employee)
+            else:
+                self._keys = None
+            self._stamp.bump()
+
+    def remove(self, *employee_ids):
+        """刪除員工後自索引移除"""
+        with self._lock:
+            if self._keys is not None and not self._stamp.changed():
+                for employee_id in employee_ids:
+                    self._remove(employee_id)
+            else:
+                self._keys = None
+            self._stamp.bump()
+
+    def invalidate(self):
+        """大量匯入後重建（本 worker 下次搜尋時重建，其他 worker 透過變更標記得知）"""
+        with self._lock:
+            self._keys = None
+            self._stamp.bump()
+
+    def _ensure_loaded(self):
+        # 呼叫端須持有 self._lock
+        if self._stamp.changed() or self._keys is None:
+            self._build()
+
+    def _build(self):
+        rows = db.session.execute(select(*EMPLOYEE_LIST_COLUMNS).where(Employee.is_admin == False)).all()
+        self._romanize = _name_romanizer()
+        self._keys, self._codes, self._employees = [], [], {}
+        for row in rows:
+            self._add(row, ordered=False)
+        self._keys.sort()
+        self._codes.sort()
+
+    def _add(self, row, ordered=True):
+        terms = {_normalize_search_text(row.employee_id), _normalize_search_text(row.username)}
+        terms.update(_name_suffixes(row.name))
+        if self._romanize and row.name:
+            terms.update(self._romanize(row.name))
+        terms.discard('')
+
+        entries = [(term, row.employee_id, row.id) for term in terms]
+        self._employees[row.id] = ({
+            'id': row.id,
+            'employee_id': row.employee_id,
+            'name': row.name,
+            'username': row.username,
+            'is_active': row.is_active
+        }, entries)
+        if ordered:
+            for entry in entries:
+                bisect.insort(self._keys, entry)
+            bisect.insort(self._codes, (row.employee_id, row.id))
+        else:
+            self._keys.extend(entries)
+            self._codes.append((row.employee_id, row.id))
+
+    def _remove(self, employee_id):
+        employee = self._employees.pop(employee_id, None)
+        if employee is None:
+            return
+        payload, entries = employee
+        for entry in entries:
+            self._discard(self._keys, entry)
+        self._discard(self._codes, (payload['employee_id'], employee_id))
+
+    @staticmethod
+    def _discard(sorted_list, item):
+        i = bisect.bisect_left(sorted_list, item)
+        if i < len(sorted_list) and sorted_list[i] == item:
+            del sorted_list[i]
+
+employee_search_index = EmployeeSearchIndex()
+
+def _ensure_employee_search_index():
+    """建立員工全文索引與同步觸發器；觸發器不存在時（新建或資料表重建後）重新建立索引內容"""
+    global _employee_fts_available
+    if db.engine.dialect.name != 'sqlite':
+        return
+    
+    trigger_sql = {
+        'employee_fts_ai': """
+            CREATE TRIGGER employee_fts_ai AFTER INSERT ON employee BEGIN
+                INSERT INTO employee_fts(rowid, employee_id, username, name)
+                VALUES (new.id, new.employee_id, new.username, new.name);
+            END""",
+        'employee_fts_ad': """
+            CREATE TRIGGER employee_fts_ad AFTER DELETE ON employee BEGIN
+                INSERT INTO employee_fts(employee_fts, rowid, employee_id, username, name)
+                VALUES ('delete', old.id, old.employee_id, old.username, old.name);
+            END""",
+        'employee_fts_au': """
+            CREATE TRIGGER employee_fts_au AFTER UPDATE OF employee_id, username, name ON employee BEGIN
+                INSERT INTO employee_fts(employee_fts, rowid, employee_id, username, name)
+                VALUES ('delete', old.id, old.employee_id, old.username, old.name);
+                INSERT INTO employee_fts(rowid, employee_id, username, name)
+                VALUES (new.id, new.employee_id, new.username, new.name);
+            END""",
+    }
+    try:
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS employee_fts USING fts5("
+                "employee_id, username, name, content='employee', content_rowid='id', tokenize='trigram')"
+            )
+            existing = set(conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'employee_fts_%'"
+            ).scalars())
+            missing = [name for name in trigger_sql if name not in existing]
+            for name in missing:
+                conn.exec_driver_sql(trigger_sql[name])
+            if missing:
+                conn.exec_driver_sql("INSERT INTO employee_fts(employee_fts) VALUES ('rebuild')")
+        _employee_fts_available = True
+    except Exception as e:
+        # 舊版 SQLite 沒有 FTS5 或 trigram 分詞器時退回 LIKE 搜尋
+        app.logger.warning(f'無法建立員工全文索引，改用 LIKE 搜尋：{e}')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    # Prometheus 抓取時以 Bearer 權杖驗證；未設定權杖則僅限管理員
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not _authorization_matches(token):
+            abort(401)
+    elif not (current_user.is_authenticated and current_user.is_admin):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/fragment_cache_stats')
+@login_required
+def fragment_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': '權限不足'})
+    
+    return jsonify(fragment_cache.stats())
+
+@app.route('/geocode_cache_stats')
+@login_required
+def geocode_cache_stats():
+    if not current_user.is_admin:
+        return jsonify({'error': '權限不足'})
+    
+    return jsonify(_geocode_cache_stats_snapshot())
 
 @app.route('/delete_attendance_record/<int:record_id>', methods=['DELETE'])
 @login_required
@@ -544,9 +2590,11 @@ def delete_attendance_record(record_id):
         return jsonify({'success': False, 'message': '權限不足'})
     
     try:
-        record = AttendanceRecord.query.get_or_404(record_id)
-        db.session.delete(record)
+        if not _delete_attendance_records_by_ids([record_id]):
+            db.session.rollback()
+            return jsonify({'success': False, 'message': '出勤記錄不存在'})
         db.session.commit()
+        fragment_cache.invalidate('attendance_record')
         return jsonify({'success': True, 'message': '出勤記錄刪除成功'})
     except Exception as e:
         db.session.rollback()
@@ -565,113 +2613,1091 @@ def batch_delete_attendance_records():
         if not record_ids:
             return jsonify({'success': False, 'message': '未選擇要刪除的記錄'})
         
-        deleted_count = 0
-        for record_id in record_ids:
-            record = AttendanceRecord.query.get(record_id)
-            if record:
-                db.session.delete(record)
-                deleted_count += 1
-        
+        deleted_count = _delete_attendance_records_by_ids([int(record_id) for record_id in record_ids])
+        if not deleted_count:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': '選取的出勤記錄不存在'})
         db.session.commit()
-        return jsonify({'success': True, 'message': f'成功刪除 {deleted_count} 筆出勤記錄'})
+        fragment_cache.invalidate('attendance_record')
+        return jsonify({'success': True, 'deleted_count': deleted_count, 'message': f'成功刪除 {deleted_count} 筆出勤記錄'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'批次刪除失敗：{str(e)}'})
 
-# 將GPS座標轉換為中文地址
-async def getAddressFromCoordinates(lat, lng):
+@app.route('/delete_attendance_records_by_filter', methods=['POST'])
+@login_required
+def delete_attendance_records_by_filter():
+    if not current_user.is_admin:
+        return jsonify({'success': False, 'message': '權限不足'})
+    
+    data = request.get_json() or {}
     try:
-        # 使用OpenStreetMap Nominatim服務 (免費，無需API key)
-        import aiohttp
-        
-        # 設置適當的請求頭
-        headers = {
-            'User-Agent': 'EmployeeManagementSystem/1.0 (https://example.com)',
-            'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8'
+        filters = {
+            'employee_id': int(data['employee_id']) if data.get('employee_id') else None,
+            'start_date': _parse_date_value(data.get('start_date')),
+            'end_date': _parse_date_value(data.get('end_date')),
+            'status': data.get('status') if data.get('status') in ('complete', 'clock_in_only') else ''
         }
+        before = _parse_date_value(data.get('before'))
+    except ValueError:
+        return jsonify({'success': False, 'message': '篩選條件格式錯誤'})
+    
+    def conditions_for(records):
+        conditions = _attendance_list_conditions(filters, records)
+        if before:
+            conditions.append(records.date < before)
+        return conditions
+    
+    # 不允許沒有任何條件的刪除，避免誤刪全部記錄
+    if not conditions_for(AttendanceRecord):
+        return jsonify({'success': False, 'message': '請至少指定一個篩選條件'})
+    
+    end_date = min(filter(None, (filters['end_date'], before)), default=None)
+    try:
+        deleted_count = _delete_attendance_records_where(conditions_for, filters['start_date'], end_date)
+        if not deleted_count:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': '沒有符合條件的出勤記錄'})
+        db.session.commit()
+        fragment_cache.invalidate('attendance_record')
+        return jsonify({'success': True, 'deleted_count': deleted_count, 'message': f'成功刪除 {deleted_count} 筆出勤記錄'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'刪除失敗：{str(e)}'})
+
+# 批次刪除時每個 DELETE 陳述式的 ID 數量（低於 SQLite 參數數量上限）
+BULK_DELETE_CHUNK_SIZE = 500
+
+def _chunked(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _parse_date_value(value):
+    """解析 YYYY-MM-DD 字串，空值回傳 None，格式錯誤時拋出 ValueError"""
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+def _delete_attendance_records_where(conditions_for, start_date=None, end_date=None, refresh_work_hours=True):
+    """刪除現行資料表與日期範圍涉及的封存資料表中符合 conditions_for(分區) 的出勤記錄及其待轉換地址，
+    並更新工時彙總，回傳刪除筆數（呼叫端負責 commit）"""
+    deleted = 0
+    affected_days = []
+    for partition in attendance_archives.partitions(start_date, end_date):
+        conditions = conditions_for(partition)
+        if refresh_work_hours:
+            affected_days += db.session.execute(
+                select(partition.employee_id, partition.date).where(*conditions)
+            ).all()
+        if partition is not AttendanceRecord:
+            deleted += _delete_archived_attendance(inspect(partition).selectable, conditions)
+            continue
+        
+        matching_ids = select(AttendanceRecord.id).where(*conditions)
+        db.session.execute(
+            delete(PendingGeocode).where(PendingGeocode.record_id.in_(matching_ids)),
+            execution_options={'synchronize_session': False}
+        )
+        deleted += db.session.execute(
+            delete(AttendanceRecord).where(*conditions),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+    if affected_days:
+        _refresh_work_hours((row.employee_id, row.date) for row in affected_days)
+    return deleted
+
+def _delete_archived_attendance(archive, conditions):
+    """刪除封存資料表中的出勤記錄：封存資料表沒有觸發器，由此寫入與現行資料表相同的變更日誌刪除標記，
+    並更新封存筆數與資料表版本，回傳刪除筆數（呼叫端負責 commit）"""
+    matching = select(archive.c.id).where(*conditions)
+    if _attendance_change_log_available:
+        db.session.execute(
+            delete(AttendanceChange).where(AttendanceChange.record_id.in_(matching)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(insert(AttendanceChange).from_select(
+            ['record_id', 'employee_id', 'date', 'op', 'changed_at'],
+            select(archive.c.id, archive.c.employee_id, archive.c.date,
+                   literal_column("'delete'"), literal_column('CURRENT_TIMESTAMP'))
+            .where(*conditions).order_by(archive.c.id)
+        ))
+    deleted = db.session.execute(delete(archive).where(*conditions)).rowcount
+    if deleted:
+        db.session.execute(
+            update(AttendanceArchive).where(AttendanceArchive.table_name == archive.name)
+            .values(row_count=AttendanceArchive.row_count - deleted)
+        )
+        db.session.execute(
+            update(TableVersion).where(TableVersion.name == AttendanceRecord.__tablename__)
+            .values(version=TableVersion.version + 1, updated_at=literal_column('CURRENT_TIMESTAMP'))
+        )
+    return deleted
+
+def _delete_attendance_records_by_ids(record_ids):
+    """依 ID 分批刪除出勤記錄（含封存資料表），回傳實際刪除筆數（呼叫端負責 commit）"""
+    deleted = 0
+    for chunk in _chunked(set(record_ids), BULK_DELETE_CHUNK_SIZE):
+        deleted += _delete_attendance_records_where(lambda records: [records.id.in_(chunk)])
+    return deleted
+
+def _delete_employees_by_ids(employee_ids):
+    """依 ID 分批刪除員工，連同人事資料與出勤記錄，回傳 (員工數, 出勤記錄數)（呼叫端負責 commit）"""
+    deleted_employees = deleted_records = 0
+    for chunk in _chunked(set(employee_ids), BULK_DELETE_CHUNK_SIZE):
+        deleted_records += _delete_attendance_records_where(
+            lambda records: [records.employee_id.in_(chunk)], refresh_work_hours=False
+        )
+        for model in (DailyWorkSummary, MonthlyWorkSummary, PunchReceipt):
+            db.session.execute(
+                delete(model).where(model.employee_id.in_(chunk)),
+                execution_options={'synchronize_session': False}
+            )
+        db.session.execute(
+            delete(EmployeeProfile).where(EmployeeProfile.id.in_(chunk)),
+            execution_options={'synchronize_session': False}
+        )
+        result = db.session.execute(
+            delete(Employee).where(Employee.id.in_(chunk)),
+            execution_options={'synchronize_session': False}
+        )
+        deleted_employees += result.rowcount
+    return deleted_employees, deleted_records
+
+@app.route('/work_hours_summary')
+@login_required
+def work_hours_summary():
+    if not current_user.is_admin:
+        return jsonify({'error': '權限不足'}), 403
+    
+    month = request.args.get('month') or date.today().strftime('%Y-%m')
+    try:
+        datetime.strptime(month, '%Y-%m')
+    except ValueError:
+        return jsonify({'error': '月份格式錯誤，請使用 YYYY-MM'}), 400
+    
+    rows = db.session.execute(
+        select(
+            Employee.id,
+            Employee.employee_id,
+            Employee.name,
+            MonthlyWorkSummary.hours,
+            MonthlyWorkSummary.days_present,
+            MonthlyWorkSummary.incomplete_days
+        )
+        .join(Employee, MonthlyWorkSummary.employee_id == Employee.id)
+        .where(MonthlyWorkSummary.month == month)
+        .order_by(Employee.employee_id)
+    ).all()
+    return jsonify({
+        'month': month,
+        'employees': [{
+            'id': row.id,
+            'employee_id': row.employee_id,
+            'name': row.name,
+            'hours': round(row.hours, 2),
+            'days_present': row.days_present,
+            'incomplete_days': row.incomplete_days
+        } for row in rows]
+    })
+
+@app.cli.command('rebuild-work-hours')
+def rebuild_work_hours_command():
+    """由出勤記錄（含封存資料表）重新建立每日與每月工時彙總"""
+    started = time.perf_counter()
+    db.session.execute(delete(DailyWorkSummary))
+    db.session.execute(delete(MonthlyWorkSummary))
+    for records in attendance_archives.partitions():
+        db.session.execute(_daily_work_hours_insert(records=records))
+    db.session.execute(_monthly_work_hours_insert())
+    db.session.commit()
+    days = db.session.execute(select(func.count()).select_from(DailyWorkSummary)).scalar()
+    click.echo(f'已重建 {days} 筆每日工時彙總（{time.perf_counter() - started:.1f} 秒）')
+
+# 每日工時：上下班都有打卡時為時間差（小時），只有上班打卡時記為未完成
+def _work_hours_expression(records):
+    return case(
+        (records.clock_out_time.isnot(None),
+         (func.julianday(records.clock_out_time) - func.julianday(records.clock_in_time)) * 24),
+        else_=0.0
+    )
+
+_month_expression = func.strftime('%Y-%m', DailyWorkSummary.date)
+
+def _daily_work_hours_insert(*conditions, records=AttendanceRecord):
+    """INSERT ... SELECT：由出勤記錄（或封存資料表）計算每日工時彙總"""
+    return insert(DailyWorkSummary).from_select(
+        ['employee_id', 'date', 'hours', 'incomplete'],
+        select(
+            records.employee_id,
+            records.date,
+            _work_hours_expression(records),
+            records.clock_out_time.is_(None)
+        ).where(records.clock_in_time.isnot(None), *conditions)
+    )
+
+def _monthly_work_hours_insert(*conditions):
+    """INSERT ... SELECT：由每日彙總計算每月工時彙總"""
+    return insert(MonthlyWorkSummary).from_select(
+        ['employee_id', 'month', 'hours', 'days_present', 'incomplete_days'],
+        select(
+            DailyWorkSummary.employee_id,
+            _month_expression,
+            func.sum(DailyWorkSummary.hours),
+            func.count(),
+            func.sum(case((DailyWorkSummary.incomplete, 1), else_=0))
+        ).where(*conditions).group_by(DailyWorkSummary.employee_id, _month_expression)
+    )
+
+def _refresh_work_hours(keys):
+    """重新計算指定 (員工, 日期) 的每日彙總及其所屬月份，只處理受影響的資料（呼叫端負責 commit）"""
+    keys = set(keys)
+    months = {(employee_id, day.strftime('%Y-%m')) for employee_id, day in keys}
+    for chunk in _chunked(keys, BULK_DELETE_CHUNK_SIZE):
+        daily_key = tuple_(DailyWorkSummary.employee_id, DailyWorkSummary.date).in_(chunk)
+        db.session.execute(delete(DailyWorkSummary).where(daily_key), execution_options={'synchronize_session': False})
+        db.session.execute(_daily_work_hours_insert(tuple_(AttendanceRecord.employee_id, AttendanceRecord.date).in_(chunk)))
+    for chunk in _chunked(months, BULK_DELETE_CHUNK_SIZE):
+        db.session.execute(
+            delete(MonthlyWorkSummary).where(tuple_(MonthlyWorkSummary.employee_id, MonthlyWorkSummary.month).in_(chunk)),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.execute(_monthly_work_hours_insert(tuple_(DailyWorkSummary.employee_id, _month_expression).in_(chunk)))
+
+@app.cli.command('archive-attendance')
+@click.option('--keep-months', default=2, show_default=True, help='現行資料表保留的月份數（含本月）')
+@click.option('--dry-run', is_flag=True, help='只列出將封存的月份與筆數')
+def archive_attendance_command(keep_months, dry_run):
+    """將已結束月份的出勤記錄搬移到每月一個的封存資料表，現行資料表只保留最近幾個月"""
+    if keep_months < 1:
+        raise click.BadParameter('至少需保留本月', param_hint='--keep-months')
+    # 封存的記錄保留原本的 id，現行資料表沒有 AUTOINCREMENT 時新記錄可能重複使用這些 id
+    create_sql = db.session.connection().exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'attendance_record'"
+    ).scalar()
+    if 'AUTOINCREMENT' not in create_sql.upper():
+        raise click.ClickException('attendance_record 尚未加上 AUTOINCREMENT，請先執行 python migrate_db.py')
+    cutoff = date.today().replace(day=1)
+    for _ in range(keep_months - 1):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+    
+    month_expression = func.strftime('%Y-%m', AttendanceRecord.date)
+    months = db.session.execute(
+        select(month_expression, func.count())
+        .where(AttendanceRecord.date < cutoff)
+        .group_by(month_expression)
+        .order_by(month_expression)
+    ).all()
+    if not months:
+        click.echo(f'{cutoff:%Y-%m} 之前沒有需要封存的出勤記錄')
+        return
+    
+    for month, count in months:
+        if dry_run:
+            click.echo(f'{month}：{count} 筆')
+            continue
+        started = time.perf_counter()
+        moved = _archive_attendance_month(month)
+        db.session.commit()
+        attendance_archives.invalidate()
+        click.echo(f'{month}：已封存 {moved} 筆，{count - moved} 筆仍在待轉換地址佇列（{time.perf_counter() - started:.1f} 秒）')
+
+# 封存資料表不由 db.create_all 建立，第一次封存該月份時才建立
+_archive_metadata = db.MetaData()
+
+def _archive_table(table_name):
+    """封存資料表：欄位與 attendance_record 相同（不設外鍵，刪除員工時另外清除）"""
+    if table_name in _archive_metadata.tables:
+        return _archive_metadata.tables[table_name]
+    columns = [
+        db.Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+        for column in AttendanceRecord.__table__.columns
+    ]
+    return db.Table(
+        table_name, _archive_metadata, *columns,
+        db.Index(f'ix_{table_name}_date_id', 'date', 'id'),
+        db.Index(f'uq_{table_name}_employee_date', 'employee_id', 'date', unique=True)
+    )
+
+def _archive_attendance_month(month):
+    """將一個月份的出勤記錄搬移到封存資料表並登記，回傳搬移筆數；
+    仍在待轉換地址佇列中的記錄留在現行資料表，下次封存時再搬移（呼叫端負責 commit）"""
+    table_name = f"attendance_record_{month.replace('-', '')}"
+    archive = _archive_table(table_name)
+    archive.create(db.session.connection(), checkfirst=True)
+    
+    live = AttendanceRecord.__table__
+    first_day = datetime.strptime(month, '%Y-%m').date()
+    in_month = [live.c.date >= first_day, live.c.date < (first_day + timedelta(days=32)).replace(day=1)]
+    moved = db.session.execute(
+        insert(archive).from_select(
+            list(live.c.keys()),
+            select(live).where(*in_month, live.c.id.notin_(select(PendingGeocode.record_id)))
+        )
+    ).rowcount
+    db.session.execute(delete(live).where(*in_month, live.c.id.in_(select(archive.c.id))))
+    # 搬移時觸發器產生的刪除標記不是真正的刪除，從變更日誌移除，下游增量匯出不受影響
+    db.session.execute(
+        delete(AttendanceChange).where(AttendanceChange.op == 'delete', AttendanceChange.record_id.in_(select(archive.c.id))),
+        execution_options={'synchronize_session': False}
+    )
+    
+    row_count = db.session.execute(select(func.count()).select_from(archive)).scalar()
+    stmt = sqlite_insert(AttendanceArchive).values(
+        month=month, table_name=table_name, row_count=row_count, archived_at=datetime.utcnow()
+    )
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[AttendanceArchive.month],
+        set_={'row_count': stmt.excluded.row_count, 'archived_at': stmt.excluded.archived_at}
+    ))
+    return moved
+
+class AttendanceArchiveRegistry:
+    """已封存月份與其資料表的快取；查詢依日期範圍只合併需要的封存資料表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None
+        self._stamp = ChangeStamp('attendance_archive')
+
+    def months(self):
+        """已封存的月份（YYYY-MM）"""
+        return set(self._ensure_loaded())
+
+    def tables(self):
+        return list(self._ensure_loaded().values())
+
+    def partitions(self, start_date=None, end_date=None):
+        """回傳查詢日期範圍需要的出勤記錄來源：現行資料表，加上月份與範圍重疊的封存資料表（映射為 AttendanceRecord 別名）"""
+        start_month = start_date.strftime('%Y-%m') if start_date else ''
+        end_month = end_date.strftime('%Y-%m') if end_date else '9999-99'
+        return [AttendanceRecord] + [
+            aliased(AttendanceRecord, table, adapt_on_names=True)
+            for month, table in self._ensure_loaded().items()
+            if start_month <= month <= end_month
+        ]
+
+    def invalidate(self):
+        with self._lock:
+            self._tables = None
+        self._stamp.bump()
+
+    def _ensure_loaded(self):
+        if self._stamp.changed():
+            with self._lock:
+                self._tables = None
+        tables = self._tables
+        if tables is None:
+            with self._lock:
+                if self._tables is None:
+                    rows = db.session.execute(
+                        select(AttendanceArchive.month, AttendanceArchive.table_name).order_by(AttendanceArchive.month.desc())
+                    ).all()
+                    self._tables = {row.month: _archive_table(row.table_name) for row in rows}
+                tables = self._tables
+        return tables
+
+attendance_archives = AttendanceArchiveRegistry()
+
+def _attendance_source(start_date=None, end_date=None):
+    """日期範圍涉及封存月份時，回傳各分區 UNION ALL 後的 AttendanceRecord 別名，否則就是 AttendanceRecord"""
+    partitions = attendance_archives.partitions(start_date, end_date)
+    if len(partitions) == 1:
+        return AttendanceRecord
+    return _union_attendance_partitions(select(partition) for partition in partitions)
+
+def _union_attendance_partitions(statements):
+    """將各分區欄位相同的查詢 UNION ALL，包成可當作 AttendanceRecord 使用的別名"""
+    return aliased(AttendanceRecord, union_all(*statements).subquery('attendance_record_all'), adapt_on_names=True)
+
+@app.route('/work_sites')
+@login_required
+def work_sites():
+    if not current_user.is_admin:
+        flash('權限不足')
+        return redirect(url_for('dashboard'))
+    
+    sites = db.session.execute(
+        select(WorkSite.id, WorkSite.name, WorkSite.address, WorkSite.latitude, WorkSite.longitude,
+               WorkSite.radius_m, WorkSite.polygon.isnot(None).label('has_polygon'), WorkSite.is_active)
+        .order_by(WorkSite.name)
+    ).all()
+    return render_template('work_sites.html', sites=sites)
+
+@app.route('/add_work_site', methods=['POST'])
+@login_required
+def add_work_site():
+    if not current_user.is_admin:
+        flash('權限不足')
+        return redirect(url_for('dashboard'))
+    
+    try:
+        site = WorkSite(
+            name=request.form['name'].strip(),
+            address=request.form.get('address', '').strip() or None,
+            latitude=float(request.form['latitude']),
+            longitude=float(request.form['longitude']),
+            radius_m=float(request.form.get('radius_m') or WORK_SITE_DEFAULT_RADIUS),
+            polygon=_parse_work_site_polygon(request.form.get('polygon'))
+        )
+        if not site.name or site.radius_m <= 0:
+            raise ValueError('名稱不可為空，半徑必須大於 0')
+        db.session.add(site)
+        db.session.commit()
+    except (KeyError, ValueError) as e:
+        db.session.rollback()
+        flash(f'新增工作地點失敗：{str(e)}')
+        return redirect(url_for('work_sites'))
+    
+    work_site_index.invalidate()
+    fragment_cache.invalidate('work_site')
+    flash(f'工作地點 {site.name} 新增成功')
+    return redirect(url_for('work_sites'))
+
+@app.route('/toggle_work_site_status/<int:id>')
+@login_required
+def toggle_work_site_status(id):
+    if not current_user.is_admin:
+        flash('權限不足')
+        return redirect(url_for('dashboard'))
+    
+    site = WorkSite.query.get_or_404(id)
+    site.is_active = not site.is_active
+    db.session.commit()
+    work_site_index.invalidate()
+    fragment_cache.invalidate('work_site')
+    
+    status = '啟用' if site.is_active else '停用'
+    flash(f'工作地點 {site.name} 已{status}')
+    return redirect(url_for('work_sites'))
+
+@app.route('/delete_work_site/<int:id>')
+@login_required
+def delete_work_site(id):
+    if not current_user.is_admin:
+        flash('權限不足')
+        return redirect(url_for('dashboard'))
+    
+    # 保留出勤記錄的在場判定，只移除地點關聯（含封存資料表）
+    archived = 0
+    for records in [AttendanceRecord.__table__] + attendance_archives.tables():
+        for site_column in (records.c.clock_in_site_id, records.c.clock_out_site_id):
+            updated = db.session.execute(
+                update(records).where(site_column == id).values({site_column.name: None}),
+                execution_options={'synchronize_session': False}
+            ).rowcount
+            if records is not AttendanceRecord.__table__:
+                archived += updated
+    if archived:
+        # 封存資料表沒有觸發器，自行遞增資料表版本
+        db.session.execute(
+            update(TableVersion).where(TableVersion.name == AttendanceRecord.__tablename__)
+            .values(version=TableVersion.version + 1, updated_at=literal_column('CURRENT_TIMESTAMP'))
+        )
+    deleted = db.session.execute(
+        delete(WorkSite).where(WorkSite.id == id),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if not deleted:
+        db.session.rollback()
+        abort(404)
+    db.session.commit()
+    work_site_index.invalidate()
+    fragment_cache.invalidate('work_site')
+    flash('工作地點已刪除')
+    return redirect(url_for('work_sites'))
+
+@app.cli.command('import-work-sites')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_work_sites_command(path):
+    """從 CSV（name, address, latitude, longitude, radius_m）匯入工作地點"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        rows = [
+            {
+                'name': row['name'].strip(),
+                'address': (row.get('address') or '').strip() or None,
+                'latitude': float(row['latitude']),
+                'longitude': float(row['longitude']),
+                'radius_m': float(row.get('radius_m') or WORK_SITE_DEFAULT_RADIUS),
+                'is_active': True,
+                'created_at': datetime.utcnow()
+            }
+            for row in csv.DictReader(f)
+        ]
+    for chunk in _chunked(rows, BULK_DELETE_CHUNK_SIZE):
+        db.session.execute(insert(WorkSite), chunk)
+    db.session.commit()
+    work_site_index.invalidate()
+    click.echo(f'已匯入 {len(rows)} 個工作地點')
+
+# 未指定半徑時的預設打卡範圍（公尺）
+WORK_SITE_DEFAULT_RADIUS = 100
+EARTH_RADIUS_M = 6371000
+
+def _parse_work_site_polygon(value):
+    """驗證多邊形 JSON（[[緯度, 經度], ...]，至少三點），空值回傳 None"""
+    if not value or not value.strip():
+        return None
+    try:
+        points = [(float(lat), float(lng)) for lat, lng in json.loads(value)]
+    except (TypeError, ValueError):
+        raise ValueError('多邊形格式錯誤，請使用 [[緯度, 經度], ...]')
+    if len(points) < 3:
+        raise ValueError('多邊形至少需要三個頂點')
+    return json.dumps(points)
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    # 等距圓柱近似，工作地點範圍內（數公里）誤差可忽略
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+class IndexedWorkSite:
+    """索引中的工作地點（不綁定資料庫 session）"""
+
+    __slots__ = ('id', 'name', 'address', 'latitude', 'longitude', 'radius_m', 'polygon', 'bounds')
+
+    def __init__(self, row):
+        self.id = row.id
+        self.name = row.name
+        self.address = row.address
+        self.latitude = row.latitude
+        self.longitude = row.longitude
+        self.radius_m = row.radius_m
+        self.polygon = [tuple(point) for point in json.loads(row.polygon)] if row.polygon else None
+        if self.polygon:
+            lats = [lat for lat, _ in self.polygon]
+            lngs = [lng for _, lng in self.polygon]
+            self.bounds = (min(lats), min(lngs), max(lats), max(lngs))
+        else:
+            lat_delta = math.degrees(self.radius_m / EARTH_RADIUS_M)
+            lng_delta = lat_delta / max(math.cos(math.radians(self.latitude)), 0.01)
+            self.bounds = (self.latitude - lat_delta, self.longitude - lng_delta,
+                           self.latitude + lat_delta, self.longitude + lng_delta)
+
+    def contains(self, lat, lng, distance):
+        if self.polygon is None:
+            return distance <= self.radius_m
+        # 射線法判斷點是否在多邊形內
+        inside = False
+        j = len(self.polygon) - 1
+        for i, (lat_i, lng_i) in enumerate(self.polygon):
+            lat_j, lng_j = self.polygon[j]
+            if (lng_i > lng) != (lng_j > lng) and lat < (lat_j - lat_i) * (lng - lng_i) / (lng_j - lng_i) + lat_i:
+                inside = not inside
+            j = i
+        return inside
+
+class WorkSiteIndex:
+    """工作地點的記憶體網格索引：每個地點登記在其範圍外框涵蓋的網格中，
+    判定時只檢查打卡座標所在網格的候選地點，與地點總數無關"""
+
+    def __init__(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self._lock = threading.Lock()
+        self._cells = None
+        self._stamp = ChangeStamp('work_sites')
+
+    def _cell(self, lat, lng):
+        return math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees)
+
+    def classify(self, latitude, longitude):
+        """回傳 (工作地點, 是否在場)；未提供座標或尚未設定任何工作地點時為 (None, None)"""
+        try:
+            lat, lng = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            return None, None
+        cells = self._ensure_loaded()
+        if not cells:
+            return None, None
         
-        async with aiohttp.ClientSession() as session:
-            url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json&accept-language=zh-TW"
-            async with session.get(url, headers=headers) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if 'display_name' in data:
-                        # 嘗試提取更好的中文地址格式
-                        if '台灣' in data['display_name'] or 'Taiwan' in data['display_name']:
-                            # 解析地址組件
-                            address_components = data.get('address', {})
-                            
-                            # 嘗試構建標準台灣地址格式
-                            city = address_components.get('city', '') or address_components.get('county', '')
-                            district = address_components.get('district', '') or address_components.get('suburb', '')
-                            road = address_components.get('road', '')
-                            house_number = address_components.get('house_number', '')
-                            
-                            # 構建地址字串
-                            address_parts = []
-                            
-                            if city:
-                                address_parts.append(city)
-                            if district:
-                                address_parts.append(district)
-                            if road:
-                                if house_number:
-                                    address_parts.append(f"{road}{house_number}號")
-                                else:
-                                    address_parts.append(road)
-                            
-                            # 如果有完整的地址組件，使用它們
-                            if address_parts:
-                                return ''.join(address_parts)
-                            
-                            # 備用方案：從display_name提取
-                            address = data['display_name']
-                            parts = address.split(',')
-                            taiwan_parts = []
-                            for part in parts:
-                                part = part.strip()
-                                # 過濾掉不需要的部分
-                                if any(keyword in part for keyword in ['台灣', 'Taiwan', 'Republic of China']):
-                                    continue
-                                if any(keyword in part for keyword in ['市', '區', '縣', '鎮', '里', '路', '街', '巷', '弄', '號']):
-                                    taiwan_parts.append(part)
-                            
-                            if taiwan_parts:
-                                # 取最相關的3-4個部分
-                                return ''.join(taiwan_parts[-4:])
+        # 多個地點重疊時取距離中心最近者
+        best = None
+        for site in cells.get(self._cell(lat, lng), ()):
+            distance = _distance_m(lat, lng, site.latitude, site.longitude)
+            if site.contains(lat, lng, distance) and (best is None or distance < best[0]):
+                best = (distance, site)
+        return (best[1], True) if best else (None, False)
+
+    def invalidate(self):
+        """工作地點異動後重建（本 worker 立即重建，其他 worker 透過變更標記得知）"""
+        with self._lock:
+            self._cells = None
+        self._stamp.bump()
+
+    def _ensure_loaded(self):
+        if self._stamp.changed():
+            with self._lock:
+                self._cells = None
+        cells = self._cells
+        if cells is None:
+            with self._lock:
+                if self._cells is None:
+                    self._cells = self._build()
+                cells = self._cells
+        return cells
+
+    def _build(self):
+        rows = db.session.execute(
+            select(WorkSite.id, WorkSite.name, WorkSite.address, WorkSite.latitude, WorkSite.longitude,
+                   WorkSite.radius_m, WorkSite.polygon)
+            .where(WorkSite.is_active)
+        ).all()
+        cells = {}
+        for row in rows:
+            site = IndexedWorkSite(row)
+            min_lat, min_lng, max_lat, max_lng = site.bounds
+            min_cell, max_cell = self._cell(min_lat, min_lng), self._cell(max_lat, max_lng)
+            for cell_lat in range(min_cell[0], max_cell[0] + 1):
+                for cell_lng in range(min_cell[1], max_cell[1] + 1):
+                    cells.setdefault((cell_lat, cell_lng), []).append(site)
+        return cells
+
+work_site_index = WorkSiteIndex(app.config['WORK_SITE_GRID'])
+
+@app.cli.command('build-gazetteer')
+@click.argument('source', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', default=None, help='輸出檔案（預設為 GAZETTEER_PATH）')
+def build_gazetteer_command(source, output):
+    """由門牌點 CSV（緯度、經度與縣市/區/路/門牌或完整地址欄位）建立離線地址索引"""
+    output = output or app.config['GAZETTEER_PATH']
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    started = time.perf_counter()
+    count = build_gazetteer(read_source_rows(source), output)
+    click.echo(f'已建立 {count} 筆門牌索引：{output}（{time.perf_counter() - started:.1f} 秒）')
+
+# 將GPS座標轉換為中文地址
+async def getAddressFromCoordinates(lat, lng):
+    # 斷路器開啟時不呼叫外部服務，直接使用備用格式
+    if not geocode_breaker.allow():
+        return f"座標位置 ({lat:.4f}, {lng:.4f})"
+    
+    try:
+        # 使用OpenStreetMap Nominatim服務 (免費，無需API key)，共用連線池
+        session = await _get_aiohttp_session()
+        url = f"{NOMINATIM_REVERSE_URL}?lat={lat}&lon={lng}&format=json&accept-language=zh-TW"
+        async with session.get(url) as response:
+            _record_geocode_response(response.status)
+            if response.status == 200:
+                data = await response.json()
+                if 'display_name' in data:
+                    # 嘗試提取更好的中文地址格式
+                    if '台灣' in data['display_name'] or 'Taiwan' in data['display_name']:
+                        # 解析地址組件
+                        address_components = data.get('address', {})
+                        
+                        # 嘗試構建標準台灣地址格式
+                        city = address_components.get('city', '') or address_components.get('county', '')
+                        district = address_components.get('district', '') or address_components.get('suburb', '')
+                        road = address_components.get('road', '')
+                        house_number = address_components.get('house_number', '')
                         
-                        # 如果不是台灣地址，嘗試簡化
+                        # 構建地址字串
+                        address_parts = []
+                        
+                        if city:
+                            address_parts.append(city)
+                        if district:
+                            address_parts.append(district)
+                        if road:
+                            if house_number:
+                                address_parts.append(f"{road}{house_number}號")
+                            else:
+                                address_parts.append(road)
+                        
+                        # 如果有完整的地址組件，使用它們
+                        if address_parts:
+                            return ''.join(address_parts)
+                        
+                        # 備用方案：從display_name提取
                         address = data['display_name']
                         parts = address.split(',')
-                        # 取最後幾個部分，避免過長的地址
-                        if len(parts) > 4:
-                            return ''.join(parts[-4:])
-                        else:
-                            return address
+                        taiwan_parts = []
+                        for part in parts:
+                            part = part.strip()
+                            # 過濾掉不需要的部分
+                            if any(keyword in part for keyword in ['台灣', 'Taiwan', 'Republic of China']):
+                                continue
+                            if any(keyword in part for keyword in ['市', '區', '縣', '鎮', '里', '路', '街', '巷', '弄', '號']):
+                                taiwan_parts.append(part)
+                        
+                        if taiwan_parts:
+                            # 取最相關的3-4個部分
+                            return ''.join(taiwan_parts[-4:])
+                    
+                    # 如果不是台灣地址，嘗試簡化
+                    address = data['display_name']
+                    parts = address.split(',')
+                    # 取最後幾個部分，避免過長的地址
+                    if len(parts) > 4:
+                        return ''.join(parts[-4:])
                     else:
-                        return "地址解析失敗"
-                elif response.status == 403:
-                    # 如果被阻擋，使用備用服務
-                    return f"座標位置 ({lat:.4f}, {lng:.4f})"
+                        return address
                 else:
                     return "地址解析失敗"
-    except Exception as e:
-        # 如果主要服務失敗，使用備用格式
+            elif response.status == 403:
+                # 如果被阻擋，使用備用服務
+                return f"座標位置 ({lat:.4f}, {lng:.4f})"
+            else:
+                return "地址解析失敗"
+    except Exception:
+        # 如果主要服務失敗（含逾時），使用備用格式
+        geocode_breaker.record_failure()
         return f"座標位置 ({lat:.4f}, {lng:.4f})"
 
-# 簡化版本（同步）
-def getAddressFromCoordinatesSync(lat, lng):
+# 地址快取：座標先對齊到網格，同一網格共用一筆地址
+_geocode_memory_cache = LRUCache(app.config['GEOCODE_CACHE_SIZE'], app.config['GEOCODE_CACHE_TTL'])
+_geocode_stats_lock = threading.Lock()
+_geocode_stats = {'offline_hits': 0, 'memory_hits': 0, 'db_hits': 0, 'misses': 0}
+
+def _count_geocode_stat(name):
+    with _geocode_stats_lock:
+        _geocode_stats[name] += 1
+
+def _geocode_cell_key(lat, lng):
+    """將座標對齊到網格，回傳快取鍵值（包含網格大小，調整設定後舊資料自然失效）"""
+    grid = app.config['GEOCODE_CACHE_GRID']
+    return f"{grid:g}:{math.floor(float(lat) / grid)}:{math.floor(float(lng) / grid)}"
+
+def _is_resolved_address(address):
+    """判斷是否為成功解析的地址（備用格式與失敗訊息不寫入快取）"""
+    return bool(address) and address != '地址解析失敗' and not address.startswith('座標位置')
+
+def _get_cached_address(cell_key):
+    """依序查詢記憶體快取與資料庫快取，找不到時回傳 None"""
+    address = _geocode_memory_cache.get(cell_key)
+    if address is not None:
+        _count_geocode_stat('memory_hits')
+        return address
+    
+    try:
+        with db.engine.connect() as conn:
+            row = conn.execute(
+                select(GeocodeCache.address, GeocodeCache.updated_at)
+                .where(GeocodeCache.cell_key == cell_key)
+            ).first()
+    except Exception as e:
+        app.logger.warning(f'讀取地址快取失敗：{e}')
+        return None
+    
+    if row and row.updated_at > datetime.utcnow() - timedelta(seconds=app.config['GEOCODE_CACHE_TTL']):
+        _geocode_memory_cache.set(cell_key, row.address)
+        _count_geocode_stat('db_hits')
+        return row.address
+    return None
+
+def _store_cached_address(cell_key, address):
+    """寫入記憶體快取與資料庫快取"""
+    _geocode_memory_cache.set(cell_key, address)
+    now = datetime.utcnow()
+    try:
+        with db.engine.begin() as conn:
+            stmt = sqlite_insert(GeocodeCache).values(cell_key=cell_key, address=address, updated_at=now)
+            conn.execute(stmt.on_conflict_do_update(
+                index_elements=[GeocodeCache.cell_key],
+                set_={'address': address, 'updated_at': now}
+            ))
+    except Exception as e:
+        app.logger.warning(f'寫入地址快取失敗：{e}')
+
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_HEADERS = {
+    'User-Agent': 'EmployeeManagementSystem/1.0 (https://example.com)',
+    'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8'
+}
+
+geocode_breaker = CircuitBreaker(app.config['GEOCODE_BREAKER_FAILURES'], app.config['GEOCODE_BREAKER_COOLDOWN'])
+
+def _record_geocode_response(status):
+    # 403（被封鎖）、429（超過流量）與 5xx 視為服務異常，其他狀態代表服務正常回應
+    if status in (403, 429) or status >= 500:
+        geocode_breaker.record_failure()
+    else:
+        geocode_breaker.record_success()
+
+_http_session = None
+_http_session_pid = None
+_http_fetch_pool = None
+_http_session_lock = threading.Lock()
+
+def _get_http_session():
+    """同步查詢共用的 keep-alive 連線池與查詢執行緒（fork 後重新建立）"""
+    global _http_session, _http_session_pid, _http_fetch_pool
+    with _http_session_lock:
+        if _http_session is None or _http_session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['GEOCODE_POOL_SIZE'], max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            session.headers.update(NOMINATIM_HEADERS)
+            _http_session, _http_session_pid = session, os.getpid()
+            _http_fetch_pool = ThreadPoolExecutor(max_workers=app.config['GEOCODE_POOL_SIZE'], thread_name_prefix='geocode')
+        return _http_session
+
+def _fetch_with_deadline(url):
+    """在背景執行緒發出同步查詢，呼叫端最多等待 GEOCODE_TIMEOUT_SECONDS；
+    requests 的 timeout 只限制每次連線與讀取，緩慢滴送的回應由此限制整體時間（逾時拋出 TimeoutError）"""
+    timeout = app.config['GEOCODE_TIMEOUT_SECONDS']
+    session = _get_http_session()
+    future = _http_fetch_pool.submit(session.get, url, timeout=timeout)
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        # 尚未開始的查詢直接取消；進行中的查詢留在背景執行緒，由 requests 的 timeout 結束
+        future.cancel()
+        raise TimeoutError('地址服務回應超過時間上限')
+
+_aiohttp_session = None
+_aiohttp_session_loop = None
+
+async def _get_aiohttp_session():
+    """背景佇列共用的 aiohttp 連線池，綁定目前的事件迴圈，總時間上限套用到每個請求"""
+    global _aiohttp_session, _aiohttp_session_loop
+    import aiohttp
+    
+    loop = asyncio.get_running_loop()
+    if _aiohttp_session is None or _aiohttp_session.closed or _aiohttp_session_loop is not loop:
+        _aiohttp_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=app.config['GEOCODE_POOL_SIZE'], ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=app.config['GEOCODE_TIMEOUT_SECONDS']),
+            headers=NOMINATIM_HEADERS
+        )
+        _aiohttp_session_loop = loop
+    return _aiohttp_session
+
+_gazetteer = None
+_gazetteer_mtime = None
+# 重建後會關閉舊索引的 mmap，查詢期間需持有此鎖（可重入，查詢中可再呼叫 _get_gazetteer）
+_gazetteer_lock = threading.RLock()
+
+def _get_gazetteer():
+    """開啟離線地址索引（索引檔重建後自動重新開啟並關閉舊索引）；未建立索引時回傳 None"""
+    global _gazetteer, _gazetteer_mtime
+    path = app.config['GAZETTEER_PATH']
     try:
-        import requests
+        mtime = os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        mtime = None
+    if mtime != _gazetteer_mtime:
+        with _gazetteer_lock:
+            if mtime != _gazetteer_mtime:
+                gazetteer = None
+                if mtime is not None:
+                    try:
+                        gazetteer = Gazetteer(path)
+                    except (OSError, ValueError, RuntimeError) as e:
+                        app.logger.warning(f'無法開啟離線地址索引 {path}：{e}')
+                previous = _gazetteer
+                _gazetteer, _gazetteer_mtime = gazetteer, mtime
+                if previous is not None:
+                    previous.close()
+    return _gazetteer
+
+def _lookup_offline_address(lat, lng):
+    """以離線門牌索引查詢最近的地址，找不到時回傳 None"""
+    with _gazetteer_lock:
+        gazetteer = _get_gazetteer()
+        if gazetteer is None:
+            return None
+        match = gazetteer.nearest(float(lat), float(lng), app.config['GAZETTEER_MAX_DISTANCE_M'])
+    if match is None:
+        return None
+    _count_geocode_stat('offline_hits')
+    return match[0]
+
+def _geocode_cache_stats_snapshot():
+    with _geocode_stats_lock:
+        stats = dict(_geocode_stats)
+    hits = stats['offline_hits'] + stats['memory_hits'] + stats['db_hits']
+    lookups = hits + stats['misses']
+    stats['memory_size'] = len(_geocode_memory_cache)
+    stats['offline_size'] = len(_get_gazetteer() or ())
+    stats['hit_rate'] = round(hits / lookups, 4) if lookups else 0.0
+    stats['circuit'] = geocode_breaker.state
+    return stats
+
+# 簡化版本（同步），先查離線索引與快取，未命中才呼叫外部服務
+def getAddressFromCoordinatesSync(lat, lng):
+    address = _lookup_offline_address(lat, lng)
+    if address is not None:
+        return address
+    
+    cell_key = _geocode_cell_key(lat, lng)
+    address = _get_cached_address(cell_key)
+    if address is not None:
+        return address
+    
+    _count_geocode_stat('misses')
+    if not app.config['GEOCODE_NETWORK_FALLBACK']:
+        return _getAddressFromBackupService(lat, lng)
+    with metrics.timer('geocode_request_seconds', mode='sync'):
+        address = _fetchAddressFromNominatim(lat, lng)
+    if _is_resolved_address(address):
+        _store_cached_address(cell_key, address)
+    else:
+        metrics.inc('geocode_errors_total', mode='sync')
+    return address
+
+def _resolve_punch_address(lat, lng):
+    """打卡時取得地址，回傳 (地址, 是否需要背景轉換)；啟用佇列時不會等待外部服務"""
+    if not app.config['GEOCODE_QUEUE_ENABLED']:
+        return getAddressFromCoordinatesSync(lat, lng), False
+    
+    address = _lookup_offline_address(lat, lng)
+    if address is not None:
+        return address, False
+    
+    address = _get_cached_address(_geocode_cell_key(lat, lng))
+    if address is None and not app.config['GEOCODE_NETWORK_FALLBACK']:
+        _count_geocode_stat('misses')
+        return _getAddressFromBackupService(lat, lng), False
+    return address, address is None
+
+def _enqueue_geocode(record_id, punch_type, lat, lng):
+    """將打卡座標加入待轉換佇列，與打卡記錄在同一個交易中寫入"""
+    db.session.add(PendingGeocode(
+        record_id=record_id,
+        punch_type=punch_type,
+        latitude=lat,
+        longitude=lng,
+        cell_key=_geocode_cell_key(lat, lng)
+    ))
+
+class GeocodeQueueWorker:
+    """背景地址轉換 worker：認領佇列中的座標，同一網格只查詢一次，並限制同時連線數"""
+
+    def __init__(self):
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._token = None
+
+    def start(self):
+        # gunicorn fork 之後執行緒不會被複製，因此以 pid 判斷是否需要重新啟動
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._token = uuid.uuid4().hex
+            self._thread = threading.Thread(target=self._run, name='geocode-queue', daemon=True)
+            self._thread.start()
+
+    def notify(self):
+        self.start()
+        self._wakeup.set()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        semaphore = asyncio.Semaphore(app.config['GEOCODE_WORKERS'])
+        while True:
+            processed = 0
+            try:
+                with app.app_context():
+                    batch = self._claim_batch()
+                    if batch:
+                        loop.run_until_complete(self._process_batch(batch, semaphore))
+                    processed = len(batch)
+            except Exception as e:
+                app.logger.warning(f'背景地址轉換失敗：{e}')
+            if not processed:
+                self._wakeup.wait(app.config['GEOCODE_QUEUE_POLL_SECONDS'])
+                self._wakeup.clear()
+
+    def _claim_batch(self):
+        """以認領標記取得一批待處理項目，避免多個 worker 重複處理"""
+        now = datetime.utcnow()
+        available = or_(PendingGeocode.claimed_until.is_(None), PendingGeocode.claimed_until < now)
+        with db.engine.begin() as conn:
+            ids = conn.execute(
+                select(PendingGeocode.id).where(available)
+                .order_by(PendingGeocode.id).limit(app.config['GEOCODE_QUEUE_BATCH'])
+            ).scalars().all()
+            if not ids:
+                return []
+            conn.execute(
+                update(PendingGeocode)
+                .where(PendingGeocode.id.in_(ids), available)
+                .values(
+                    claimed_by=self._token,
+                    claimed_until=now + timedelta(seconds=app.config['GEOCODE_CLAIM_SECONDS']),
+                    attempts=PendingGeocode.attempts + 1
+                )
+            )
+            return conn.execute(
+                select(PendingGeocode).where(
+                    PendingGeocode.id.in_(ids),
+                    PendingGeocode.claimed_by == self._token
+                )
+            ).all()
+
+    async def _process_batch(self, batch, semaphore):
+        # 相同網格的座標合併為一次查詢
+        cells = {}
+        for item in batch:
+            cells.setdefault(item.cell_key, []).append(item)
         
-        # 設置適當的User-Agent和請求頭
-        headers = {
-            'User-Agent': 'EmployeeManagementSystem/1.0 (https://example.com)',
-            'Accept-Language': 'zh-TW,zh;q=0.9,en;q=0.8'
-        }
+        async def resolve(cell_key, items):
+            address = _lookup_offline_address(items[0].latitude, items[0].longitude) or _get_cached_address(cell_key)
+            if address is None:
+                _count_geocode_stat('misses')
+                async with semaphore:
+                    with metrics.timer('geocode_request_seconds', mode='queue'):
+                        address = await getAddressFromCoordinates(items[0].latitude, items[0].longitude)
+                if _is_resolved_address(address):
+                    _store_cached_address(cell_key, address)
+                else:
+                    metrics.inc('geocode_errors_total', mode='queue')
+            return cell_key, address
         
-        url = f"https://nominatim.openstreetmap.org/reverse?lat={lat}&lon={lng}&format=json&accept-language=zh-TW"
-        response = requests.get(url, headers=headers, timeout=10)
+        results = await asyncio.gather(*(resolve(key, items) for key, items in cells.items()))
+        for cell_key, address in results:
+            self._apply_result(cells[cell_key], address)
+
+    def _apply_result(self, items, address):
+        """寫回打卡記錄地址；失敗時延後重試，超過次數上限則寫入座標格式"""
+        resolved = _is_resolved_address(address)
+        now = datetime.utcnow()
+        with db.engine.begin() as conn:
+            for item in items:
+                if not resolved and item.attempts < app.config['GEOCODE_MAX_ATTEMPTS']:
+                    conn.execute(
+                        update(PendingGeocode)
+                        .where(PendingGeocode.id == item.id)
+                        .values(claimed_by=None, claimed_until=now + timedelta(minutes=item.attempts))
+                    )
+                    continue
+                
+                value = address if resolved else _getAddressFromBackupService(item.latitude, item.longitude)
+                column = AttendanceRecord.clock_in_address if item.punch_type == 'clock_in' else AttendanceRecord.clock_out_address
+                conn.execute(
+                    update(AttendanceRecord)
+                    .where(AttendanceRecord.id == item.record_id, column.is_(None))
+                    .values({column.key: value})
+                )
+                conn.execute(delete(PendingGeocode).where(PendingGeocode.id == item.id))
+
+geocode_worker = GeocodeQueueWorker()
+
+@app.before_request
+def _start_geocode_worker():
+    # 第一個請求時才啟動，處理上次關機前未完成的項目；匯入模組（CLI 指令、測試、gunicorn master）不會啟動執行緒
+    if app.config['GEOCODE_QUEUE_ENABLED']:
+        geocode_worker.start()
+
+def _fetchAddressFromNominatim(lat, lng):
+    # 斷路器開啟時不呼叫外部服務，直接使用備用格式
+    if not geocode_breaker.allow():
+        return _getAddressFromBackupService(lat, lng)
+    
+    try:
+        url = f"{NOMINATIM_REVERSE_URL}?lat={lat}&lon={lng}&format=json&accept-language=zh-TW"
+        response = _fetch_with_deadline(url)
+        _record_geocode_response(response.status_code)
         
         if response.status_code == 200:
             data = response.json()
@@ -739,8 +3765,9 @@ def getAddressFromCoordinatesSync(lat, lng):
             return _getAddressFromBackupService(lat, lng)
         else:
             return "地址解析失敗"
-    except Exception as e:
-        # 如果主要服務失敗，嘗試備用服務
+    except Exception:
+        # 如果主要服務失敗（含逾時），嘗試備用服務
+        geocode_breaker.record_failure()
         return _getAddressFromBackupService(lat, lng)
 
 def _getAddressFromBackupService(lat, lng):
@@ -756,6 +3783,9 @@ def _getAddressFromBackupService(lat, lng):
 def init_db():
     with app.app_context():
         db.create_all()
+        _ensure_employee_search_index()
+        _ensure_attendance_change_log()
+        _ensure_table_version_triggers()
         
         # 建立預設管理員帳號
         admin = Employee.query.filter_by(username='admin').first()
@@ -763,7 +3793,7 @@ def init_db():
             admin = Employee(
                 employee_id='ADMIN001',
                 username='admin',
-                password_hash=generate_password_hash('admin123'),
+                password_hash=generate_password_hash('admin123', app.config['PASSWORD_HASH_METHOD']),
                 name='系統管理員',
                 is_admin=True
             )
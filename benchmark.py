@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+效能基準測試 - 以合成資料測量打卡與管理頁面的延遲與吞吐量
+
+使用方式：
+    python benchmark.py --employees 10000 --days 500 --output result.json
+
+會在暫存目錄建立獨立的 SQLite 資料庫與 instance 目錄（不會動到 instance/ 中的正式資料），
+以 Flask test client 發送請求，並將 Nominatim 查詢替換為固定延遲的假服務。
+結果以 JSON 輸出（p50/p95/p99 延遲、每秒請求數、峰值記憶體），方便比較不同版本。
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+try:
+    import resource
+except ImportError:  # Windows 沒有 resource 模組
+    resource = None
+
+SCENARIOS = [
+    'clock_in_burst',
+    'concurrent_writes',
+    'attendance_records',
+    'search_employees',
+    'export_all',
+    'export_employee',
+    'batch_delete_records',
+    'batch_delete_employees',
+]
+
+# 儲存設定：legacy 為 SQLite 預設值（rollback journal、synchronous=FULL、無 mmap），tuned 為 app 預設的正式環境設定
+STORAGE_PROFILES = {
+    'legacy': {
+        'SQLITE_JOURNAL_MODE': 'DELETE',
+        'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_MMAP_SIZE': '0',
+        'SQLITE_CACHE_SIZE': '-2000',
+        'SQLITE_TEMP_STORE': 'DEFAULT',
+    },
+    'tuned': {},
+}
+
+# 合成姓名用字（中文姓名讓 trigram 全文索引與 LIKE 搜尋都有實際負載）
+SURNAMES = '陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周'
+GIVEN_CHARS = '志明淑芬家豪怡君俊傑雅婷建宏美玲宗翰佩珊冠宇欣怡承恩詩涵'
+
+# 打卡座標範圍（台北市附近），用於測試地址快取命中率
+BASE_LATITUDE = 25.03
+BASE_LONGITUDE = 121.56
+COORDINATE_SPREAD = 0.05
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='員工打卡系統效能基準測試')
+    parser.add_argument('--employees', type=int, default=1000, help='合成員工數（預設 1000）')
+    parser.add_argument('--days', type=int, default=60, help='每位員工的出勤天數（預設 60）')
+    parser.add_argument('--requests', type=int, default=200, help='每個情境的請求數（預設 200）')
+    parser.add_argument('--burst', type=int, default=500, help='上班打卡尖峰的員工數（預設 500）')
+    parser.add_argument('--concurrency', type=int, default=4, help='打卡尖峰同時執行緒數（預設 4）')
+    parser.add_argument('--writers', type=int, default=4, help='同時寫入的程序數，模擬多個 gunicorn worker（預設 4）')
+    parser.add_argument('--writes', type=int, default=200, help='同時寫入情境的打卡員工數，每人上下班各一次（預設 200）')
+    parser.add_argument('--storage-profile', choices=sorted(STORAGE_PROFILES), default='tuned',
+                        help='SQLite 儲存設定（legacy 為舊版預設值，預設 tuned）')
+    parser.add_argument('--export-days', type=int, default=30, help='全員匯出的日期區間天數（預設 30）')
+    parser.add_argument('--geocode-latency', type=float, default=0.0, help='假 Nominatim 回應延遲毫秒（預設 0）')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='要執行的情境（逗號分隔）')
+    parser.add_argument('--db', help='資料庫檔案路徑（預設建立在暫存目錄）')
+    parser.add_argument('--seed', type=int, default=42, help='亂數種子（預設 42）')
+    parser.add_argument('--output', help='結果 JSON 檔案路徑（預設輸出到 stdout）')
+    return parser.parse_args()
+
+
+def log(message):
+    print(message, file=sys.stderr, flush=True)
+
+
+def peak_rss_mb():
+    if resource is None:
+        # Windows 以 psutil 取得峰值工作集，未安裝時不記錄
+        try:
+            import psutil
+        except ImportError:
+            return None
+        return round(psutil.Process().memory_info().peak_wset / 1024 / 1024, 1)
+    # Linux 的 ru_maxrss 單位為 KB，macOS 為 bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return round(peak / 1024 / 1024, 1)
+    return round(peak / 1024, 1)
+
+
+def percentile(sorted_values, pct):
+    """最近排名法百分位數"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def synthetic_name(rng):
+    return rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN_CHARS) for _ in range(2))
+
+
+def seed_database(db_path, args, rng, password_hash):
+    """以 sqlite3 executemany 直接寫入合成員工與出勤資料"""
+    conn = sqlite3.connect(db_path)
+    conn.execute('PRAGMA synchronous = OFF')
+    cursor = conn.cursor()
+    created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S.000000')
+
+    cursor.executemany(
+        'INSERT INTO employee (employee_id, username, password_hash, name, is_active, is_admin, created_at) '
+        'VALUES (?, ?, ?, ?, 1, 0, ?)',
+        ((f'E{n:06d}', f'user{n:06d}', password_hash, synthetic_name(rng), created_at)
+         for n in range(1, args.employees + 1))
+    )
+    cursor.execute('INSERT INTO employee_profile (id) SELECT id FROM employee WHERE is_admin = 0')
+    employee_ids = [row[0] for row in cursor.execute('SELECT id FROM employee WHERE is_admin = 0')]
+
+    # 出勤資料不含今天，讓上班打卡尖峰情境可以全部成功
+    today = date.today()
+
+    def attendance_rows():
+        for day_offset in range(args.days, 0, -1):
+            day = today - timedelta(days=day_offset)
+            day_text = day.isoformat()
+            for employee_id in employee_ids:
+                clock_in = datetime(day.year, day.month, day.day, 8, rng.randrange(60), rng.randrange(60))
+                latitude = BASE_LATITUDE + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD)
+                longitude = BASE_LONGITUDE + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD)
+                # 約一成只有上班打卡
+                if rng.random() < 0.1:
+                    clock_out = None
+                else:
+                    clock_out = clock_in + timedelta(hours=9, minutes=rng.randrange(90))
+                yield (
+                    employee_id, day_text,
+                    clock_in.strftime('%Y-%m-%d %H:%M:%S.000000'), latitude, longitude, '台北市測試路',
+                    clock_out.strftime('%Y-%m-%d %H:%M:%S.000000') if clock_out else None,
+                    latitude if clock_out else None, longitude if clock_out else None,
+                    '台北市測試路' if clock_out else None
+                )
+
+    cursor.executemany(
+        'INSERT INTO attendance_record (employee_id, date, clock_in_time, clock_in_latitude, clock_in_longitude, '
+        'clock_in_address, clock_out_time, clock_out_latitude, clock_out_longitude, clock_out_address) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        attendance_rows()
+    )
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return employee_ids
+
+
+def fetch_ids(db_path, sql):
+    conn = sqlite3.connect(db_path)
+    try:
+        return [row[0] for row in conn.execute(sql)]
+    finally:
+        conn.close()
+
+
+class Runner:
+    """以 Flask test client 發送請求並記錄延遲"""
+
+    def __init__(self, flask_app, admin_id):
+        self.flask_app = flask_app
+        self.admin_id = admin_id
+
+    def client_for(self, user_id):
+        client = self.flask_app.test_client()
+        self.login(client, user_id)
+        return client
+
+    @staticmethod
+    def login(client, user_id):
+        # 直接寫入 Flask-Login 的 session，避免每次都要計算密碼雜湊
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+
+    @staticmethod
+    def timed(call):
+        """執行一次請求，回傳 (秒數, 是否成功)"""
+        started = time.perf_counter()
+        response = call()
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        ok = response.status_code < 400
+        if ok and response.is_json:
+            payload = response.get_json()
+            ok = not (isinstance(payload, dict) and (payload.get('success') is False or 'error' in payload))
+        response.close()
+        return elapsed, ok
+
+    @staticmethod
+    def summarize(latencies, errors, wall_seconds):
+        ordered = sorted(latencies)
+        to_ms = lambda value: round(value * 1000, 3) if value is not None else None
+        return {
+            'requests': len(ordered),
+            'errors': errors,
+            'seconds': round(wall_seconds, 3),
+            'rps': round(len(ordered) / wall_seconds, 2) if wall_seconds else None,
+            'p50_ms': to_ms(percentile(ordered, 50)),
+            'p95_ms': to_ms(percentile(ordered, 95)),
+            'p99_ms': to_ms(percentile(ordered, 99)),
+            'max_ms': to_ms(ordered[-1] if ordered else None),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+    def run_serial(self, calls):
+        latencies = []
+        errors = 0
+        started = time.perf_counter()
+        for call in calls:
+            elapsed, ok = self.timed(call)
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+        return self.summarize(latencies, errors, time.perf_counter() - started)
+
+
+def scenario_clock_in_burst(runner, args, rng, context):
+    """早上上班打卡尖峰：多位員工同時以 GPS 座標打卡"""
+    employee_ids = rng.sample(context['employee_ids'], min(args.burst, len(context['employee_ids'])))
+    punches = [
+        (employee_id,
+         BASE_LATITUDE + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD),
+         BASE_LONGITUDE + rng.uniform(-COORDINATE_SPREAD, COORDINATE_SPREAD))
+        for employee_id in employee_ids
+    ]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    local = threading.local()
+
+    def punch(item):
+        employee_id, latitude, longitude = item
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = runner.flask_app.test_client()
+        runner.login(client, employee_id)
+        elapsed, ok = runner.timed(
+            lambda: client.post('/clock_in', json={'latitude': latitude, 'longitude': longitude})
+        )
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += 0 if ok else 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(punch, punches))
+    context['punched'].update(employee_ids)
+    return runner.summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def _concurrent_write_worker(employee_ids, barrier, results):
+    """在獨立程序中上下班打卡，模擬多個 gunicorn worker 同時寫入同一個資料庫"""
+    import app as app_module
+    client = app_module.app.test_client()
+    latencies = []
+    errors = 0
+    barrier.wait(timeout=120)
+    started = time.time()
+    for employee_id in employee_ids:
+        Runner.login(client, employee_id)
+        for endpoint in ('/clock_in', '/clock_out'):
+            # 附上地址，只測量資料庫寫入
+            elapsed, ok = Runner.timed(lambda: client.post(endpoint, json={
+                'latitude': BASE_LATITUDE, 'longitude': BASE_LONGITUDE, 'address': '台北市測試路'
+            }))
+            latencies.append(elapsed)
+            errors += 0 if ok else 1
+    results.put((started, time.time(), latencies, errors))
+
+
+def scenario_concurrent_writes(runner, args, rng, context):
+    """多個程序同時打卡，比較不同儲存設定下的寫入吞吐量與鎖定錯誤"""
+    available = [employee_id for employee_id in context['employee_ids'] if employee_id not in context['punched']]
+    employee_ids = rng.sample(available, min(args.writes, len(available)))
+    context['punched'].update(employee_ids)
+    chunks = [employee_ids[i::args.writers] for i in range(args.writers)]
+
+    mp_context = multiprocessing.get_context('spawn')
+    barrier = mp_context.Barrier(len(chunks))
+    results = mp_context.Queue()
+    processes = [
+        mp_context.Process(target=_concurrent_write_worker, args=(chunk, barrier, results))
+        for chunk in chunks
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [latency for outcome in outcomes for latency in outcome[2]]
+    errors = sum(outcome[3] for outcome in outcomes)
+    wall_seconds = max(outcome[1] for outcome in outcomes) - min(outcome[0] for outcome in outcomes)
+    summary = runner.summarize(latencies, errors, wall_seconds)
+    summary['writers'] = len(chunks)
+    return summary
+
+
+def scenario_attendance_records(runner, args, rng, context):
+    """管理員瀏覽出勤記錄：首頁、依員工與日期篩選、往後翻頁"""
+    client = runner.client_for(context['admin_id'])
+    today = date.today()
+
+    def calls():
+        for n in range(args.requests):
+            kind = n % 3
+            if kind == 0:
+                yield lambda: client.get('/attendance_records')
+            elif kind == 1:
+                employee_id = rng.choice(context['employee_ids'])
+                start_date = (today - timedelta(days=rng.randrange(1, args.days + 1))).isoformat()
+                yield lambda: client.get(
+                    '/api/attendance_records',
+                    query_string={'employee_id': employee_id, 'start_date': start_date}
+                )
+            else:
+                cursor = f"{(today - timedelta(days=rng.randrange(1, args.days + 1))).isoformat()}:{rng.randrange(1, 10 ** 9)}"
+                yield lambda: client.get('/api/attendance_records', query_string={'cursor': cursor})
+
+    return runner.run_serial(calls())
+
+
+def scenario_search_employees(runner, args, rng, context):
+    """員工搜尋即時輸入：逐字輸入員工姓名或編號"""
+    client = runner.client_for(context['admin_id'])
+
+    def queries():
+        while True:
+            target = rng.choice(context['search_terms'])
+            for length in range(1, len(target) + 1):
+                yield target[:length]
+
+    def calls():
+        generator = queries()
+        for _ in range(args.requests):
+            query = next(generator)
+            yield lambda: client.get('/search_employees', query_string={'q': query})
+
+    return runner.run_serial(calls())
+
+
+def scenario_export_all(runner, args, rng, context):
+    """全員出勤 Excel 匯出（最近 --export-days 天）"""
+    client = runner.client_for(context['admin_id'])
+    start_date = (date.today() - timedelta(days=args.export_days)).isoformat()
+    count = max(1, args.requests // 20)
+    return runner.run_serial(
+        (lambda: client.get('/export_attendance_excel', query_string={'start_date': start_date}))
+        for _ in range(count)
+    )
+
+
+def scenario_export_employee(runner, args, rng, context):
+    """單一員工完整出勤 Excel 匯出"""
+    client = runner.client_for(context['admin_id'])
+
+    def calls():
+        for _ in range(max(1, args.requests // 4)):
+            employee_id = rng.choice(context['employee_ids'])
+            yield lambda: client.get(f'/export_attendance_excel/{employee_id}')
+
+    return runner.run_serial(calls())
+
+
+def scenario_batch_delete_records(runner, args, rng, context):
+    """批次刪除出勤記錄（每次 200 筆）"""
+    client = runner.client_for(context['admin_id'])
+    record_ids = fetch_ids(context['db_path'], 'SELECT id FROM attendance_record')
+    rng.shuffle(record_ids)
+    batches = [record_ids[i:i + 200] for i in range(0, min(len(record_ids), args.requests * 200), 200)]
+    return runner.run_serial(
+        (lambda batch=batch: client.post('/batch_delete_attendance_records', json={'record_ids': batch}))
+        for batch in batches
+    )
+
+
+def scenario_batch_delete_employees(runner, args, rng, context):
+    """批次刪除員工及其出勤記錄（每次 10 名）"""
+    client = runner.client_for(context['admin_id'])
+    employee_ids = list(context['employee_ids'])
+    rng.shuffle(employee_ids)
+    count = max(1, args.requests // 10)
+    batches = [employee_ids[i:i + 10] for i in range(0, min(len(employee_ids), count * 10), 10)]
+    return runner.run_serial(
+        (lambda batch=batch: client.post('/batch_delete_employees', data={'employee_ids': batch}))
+        for batch in batches
+    )
+
+
+SCENARIO_FUNCTIONS = {
+    'clock_in_burst': scenario_clock_in_burst,
+    'concurrent_writes': scenario_concurrent_writes,
+    'attendance_records': scenario_attendance_records,
+    'search_employees': scenario_search_employees,
+    'export_all': scenario_export_all,
+    'export_employee': scenario_export_employee,
+    'batch_delete_records': scenario_batch_delete_records,
+    'batch_delete_employees': scenario_batch_delete_employees,
+}
+
+
+def main():
+    args = parse_args()
+    selected = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in selected if name not in SCENARIO_FUNCTIONS]
+    if unknown:
+        sys.exit(f"未知的情境: {', '.join(unknown)}")
+
+    db_path = args.db
+    if db_path and os.path.exists(db_path):
+        sys.exit(f"資料庫檔案已存在: {db_path}")
+    workdir = tempfile.TemporaryDirectory(prefix='attendance-bench-')
+    if not db_path:
+        db_path = os.path.join(workdir.name, 'benchmark.db')
+
+    # 匯入 app 前設定環境變數：使用獨立資料庫、同步地址查詢（結果可重現）；
+    # instance 目錄也指向暫存目錄，變更戳記與離線地址索引不會讀寫正式的 instance/
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(db_path)
+    os.environ['INSTANCE_PATH'] = workdir.name
+    os.environ['GEOCODE_QUEUE_ENABLED'] = '0'
+    os.environ.update(STORAGE_PROFILES[args.storage_profile])
+    import app as app_module
+
+    geocode_latency = args.geocode_latency / 1000
+
+    def fake_nominatim(lat, lng):
+        if geocode_latency:
+            time.sleep(geocode_latency)
+        return f'台北市測試路{abs(hash((round(lat, 4), round(lng, 4)))) % 1000}號'
+
+    app_module._fetchAddressFromNominatim = fake_nominatim
+
+    rng = random.Random(args.seed)
+    log(f"建立合成資料：{args.employees} 名員工 × {args.days} 天 ...")
+    seed_started = time.perf_counter()
+    with app_module.app.app_context():
+        password_hash = app_module.generate_password_hash('benchmark')
+        admin_id = app_module.Employee.query.filter_by(username='admin').first().id
+    employee_ids = seed_database(db_path, args, rng, password_hash)
+    with app_module.app.app_context():
+        app_module.app.test_cli_runner().invoke(args=['rebuild-work-hours'])
+        names = [row.name for row in app_module.db.session.execute(
+            app_module.select(app_module.Employee.name).limit(200))]
+    seed_seconds = time.perf_counter() - seed_started
+    log(f"合成資料完成（{seed_seconds:.1f} 秒）")
+
+    context = {
+        'db_path': db_path,
+        'admin_id': admin_id,
+        'employee_ids': employee_ids,
+        'punched': set(),
+        'search_terms': names + [f'E{n:06d}' for n in rng.sample(range(1, args.employees + 1), min(50, args.employees))],
+    }
+    runner = Runner(app_module.app, admin_id)
+    results = {}
+    for name in SCENARIOS:
+        if name not in selected:
+            continue
+        log(f"執行情境: {name}")
+        results[name] = SCENARIO_FUNCTIONS[name](runner, args, random.Random(f'{args.seed}:{name}'), context)
+        log(f"  p50={results[name]['p50_ms']}ms p95={results[name]['p95_ms']}ms "
+            f"rps={results[name]['rps']} errors={results[name]['errors']}")
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'employees': args.employees,
+            'days': args.days,
+            'attendance_rows': args.employees * args.days,
+            'requests': args.requests,
+            'burst': args.burst,
+            'concurrency': args.concurrency,
+            'writers': args.writers,
+            'writes': args.writes,
+            'storage_profile': args.storage_profile,
+            'export_days': args.export_days,
+            'geocode_latency_ms': args.geocode_latency,
+            'seed': args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'seed_seconds': round(seed_seconds, 3),
+        'scenarios': results,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        log(f"結果已寫入 {args.output}")
+    else:
+        print(output)
+
+    with app_module.app.app_context():
+        app_module.db.engine.dispose()
+    workdir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+離線地址查詢 - 以本機門牌點資料（例如 OpenStreetMap 台灣地區匯出）將座標轉換為地址
+
+門牌點依網格排序後寫成單一二進位檔，查詢時以 mmap 開啟（多個 worker 共用作業系統的頁面快取），
+以 bisect 找出座標附近網格的資料範圍，只比對少量候選點，不需要把整份資料載入記憶體。
+
+檔案格式（little-endian）：
+    標頭     magic 'GZT1'、筆數 (uint32)、網格大小 (double)、地址字串總長度 (uint64)
+    網格鍵值 uint64 × N（(緯度網格 << 32) | 經度網格，已排序）
+    緯度     int32 × N（百萬分之一度）
+    經度     int32 × N
+    地址位移 uint32 × (N + 1)
+    地址字串 UTF-8
+"""
+
+import bisect
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b'GZT1'
+HEADER = struct.Struct('<4sIdQ')
+DEFAULT_CELL_DEGREES = 0.001  # 約 100 公尺
+EARTH_RADIUS_M = 6371000
+COORDINATE_SCALE = 1000000
+
+# 來源 CSV 可接受的欄位名稱（含 OSM addr:* 標籤）
+SOURCE_COLUMN_ALIASES = {
+    'latitude': ('latitude', 'lat', 'y'),
+    'longitude': ('longitude', 'lon', 'lng', 'x'),
+    'city': ('city', 'addr:city', 'county', 'addr:county'),
+    'district': ('district', 'addr:district', 'suburb', 'addr:suburb', 'town', 'addr:town'),
+    'road': ('road', 'street', 'addr:street'),
+    'house_number': ('house_number', 'housenumber', 'addr:housenumber'),
+    'address': ('address', 'addr:full'),
+}
+
+
+def format_taiwan_address(city='', district='', road='', house_number=''):
+    """組成台灣地址格式：縣市 + 鄉鎮市區 + 路名 + 門牌"""
+    parts = [city or '', district or '']
+    if road:
+        parts.append(road)
+        if house_number:
+            parts.append(house_number if house_number.endswith('號') else f'{house_number}號')
+    return ''.join(parts)
+
+
+def _cell_key(lat, lng, cell_degrees):
+    return (math.floor((lat + 90) / cell_degrees) << 32) | math.floor((lng + 180) / cell_degrees)
+
+
+def _distance_m(lat1, lng1, lat2, lng2):
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return math.hypot(x, y) * EARTH_RADIUS_M
+
+
+def _little_endian(values):
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def read_source_rows(path):
+    """讀取門牌點 CSV，逐筆回傳 (緯度, 經度, 地址)，缺少座標或地址的資料列略過"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        headers = {name.strip().lower(): name for name in reader.fieldnames or ()}
+        columns = {
+            field: next((headers[alias] for alias in aliases if alias in headers), None)
+            for field, aliases in SOURCE_COLUMN_ALIASES.items()
+        }
+        if not columns['latitude'] or not columns['longitude']:
+            raise ValueError('來源檔案缺少緯度或經度欄位')
+
+        def value(row, field):
+            return (row.get(columns[field]) or '').strip() if columns[field] else ''
+
+        for row in reader:
+            try:
+                lat, lng = float(value(row, 'latitude')), float(value(row, 'longitude'))
+            except ValueError:
+                continue
+            address = value(row, 'address') or format_taiwan_address(
+                value(row, 'city'), value(row, 'district'), value(row, 'road'), value(row, 'house_number')
+            )
+            if address:
+                yield lat, lng, address
+
+
+def build_gazetteer(points, path, cell_degrees=DEFAULT_CELL_DEGREES):
+    """將 (緯度, 經度, 地址) 依網格排序後寫成索引檔，回傳寫入筆數（先寫暫存檔再取代，執行中的 worker 不受影響）"""
+    records = sorted(
+        (_cell_key(lat, lng, cell_degrees), round(lat * COORDINATE_SCALE), round(lng * COORDINATE_SCALE), address)
+        for lat, lng, address in points
+    )
+    keys, lats, lngs, offsets = array('Q'), array('i'), array('i'), array('I', [0])
+    strings = bytearray()
+    for key, lat, lng, address in records:
+        keys.append(key)
+        lats.append(lat)
+        lngs.append(lng)
+        strings += address.encode('utf-8')
+        offsets.append(len(strings))
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(records), cell_degrees, len(strings)))
+        for values in (keys, lats, lngs, offsets):
+            f.write(_little_endian(values))
+        f.write(strings)
+    os.replace(temp_path, path)
+    return len(records)
+
+
+class Gazetteer:
+    """以 mmap 開啟的離線門牌索引（唯讀，可在多執行緒間共用）"""
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise RuntimeError('離線地址索引僅支援 little-endian 平台')
+        self._file = open(path, 'rb')
+        self._mmap = None
+        try:
+            # 空檔案無法 mmap（ValueError）；先確認標頭與各區段長度，截斷的檔案不會在查詢時讀到範圍外
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(self._mmap) < HEADER.size:
+                raise ValueError(f'不是離線地址索引檔：{path}')
+            magic, self.count, self.cell_degrees, strings_size = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC:
+                raise ValueError(f'不是離線地址索引檔：{path}')
+            if len(self._mmap) < HEADER.size + 20 * self.count + 4 + strings_size:
+                raise ValueError(f'離線地址索引檔不完整：{path}')
+        except Exception:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._file.close()
+            raise
+
+        view = memoryview(self._mmap)
+        position = HEADER.size
+        n = self.count
+        self._keys = view[position:position + 8 * n].cast('Q')
+        position += 8 * n
+        self._lats = view[position:position + 4 * n].cast('i')
+        position += 4 * n
+        self._lngs = view[position:position + 4 * n].cast('i')
+        position += 4 * n
+        self._offsets = view[position:position + 4 * (n + 1)].cast('I')
+        position += 4 * (n + 1)
+        self._strings = view[position:position + strings_size]
+
+    def __len__(self):
+        return self.count
+
+    def nearest(self, lat, lng, max_distance_m):
+        """回傳距離座標最近且在 max_distance_m 公尺內的 (地址, 距離)，找不到時回傳 None"""
+        cell = self.cell_degrees
+        # 搜尋範圍涵蓋的網格（經度方向的網格寬度隨緯度縮小）
+        lat_cells = math.ceil(math.degrees(max_distance_m / EARTH_RADIUS_M) / cell)
+        lng_cells = math.ceil(lat_cells / max(math.cos(math.radians(lat)), 0.01))
+        cell_lat = math.floor((lat + 90) / cell)
+        cell_lng = math.floor((lng + 180) / cell)
+
+        best_index, best_distance = None, max_distance_m
+        for row in range(cell_lat - lat_cells, cell_lat + lat_cells + 1):
+            # 同一緯度網格列中相鄰的經度網格鍵值連續，一次 bisect 取得整段範圍
+            start = bisect.bisect_left(self._keys, (row << 32) | (cell_lng - lng_cells))
+            end = bisect.bisect_right(self._keys, (row << 32) | (cell_lng + lng_cells), start)
+            for i in range(start, end):
+                distance = _distance_m(lat, lng, self._lats[i] / COORDINATE_SCALE, self._lngs[i] / COORDINATE_SCALE)
+                if distance <= best_distance:
+                    best_index, best_distance = i, distance
+        if best_index is None:
+            return None
+        address = bytes(self._strings[self._offsets[best_index]:self._offsets[best_index + 1]]).decode('utf-8')
+        return address, best_distance
+
+    def close(self):
+        for view in (self._keys, self._lats, self._lngs, self._offsets, self._strings):
+            view.release()
+        self._mmap.close()
+        self._file.close()
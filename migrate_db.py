@@ -1,18 +1,219 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-資料庫遷移腳本 - 添加GPS位置欄位
+資料庫遷移腳本 - 添加GPS位置欄位與查詢索引
 """
 
 import sqlite3
 import os
 
+# Flask-SQLAlchemy 會將相對路徑的 SQLite 檔案放在 instance 目錄
+DB_PATHS = ['instance/employee_management.db', 'employee_management.db']
+
+# 需要建立的索引：(索引名稱, 資料表, 欄位, 是否唯一)
+INDEXES = [
+    ('ix_attendance_record_date_id', 'attendance_record', 'date, id', False),
+    ('uq_attendance_record_employee_date', 'attendance_record', 'employee_id, date', True),
+]
+
+CLOCK_IN_COLUMNS = ['clock_in_time', 'clock_in_latitude', 'clock_in_longitude', 'clock_in_address']
+CLOCK_OUT_COLUMNS = ['clock_out_time', 'clock_out_latitude', 'clock_out_longitude', 'clock_out_address']
+
+# 從 employee 拆分到 employee_profile 的人事資料欄位
+PROFILE_COLUMNS = [
+    ('gender', 'VARCHAR(10)'),
+    ('birth_date', 'DATE'),
+    ('marital_status', 'VARCHAR(20)'),
+    ('id_number', 'VARCHAR(20)'),
+    ('address', 'TEXT'),
+    ('household_address', 'TEXT'),
+    ('email', 'VARCHAR(120)'),
+    ('contact_phone', 'VARCHAR(20)'),
+    ('mobile_phone', 'VARCHAR(20)'),
+    ('physical_condition', 'TEXT'),
+    ('height', 'INTEGER'),
+    ('weight', 'INTEGER'),
+    ('special_status', 'TEXT'),
+    ('disability_status', 'TEXT'),
+    ('emergency_contact_name', 'VARCHAR(100)'),
+    ('emergency_contact_relation', 'VARCHAR(50)'),
+    ('emergency_contact_phone', 'VARCHAR(20)'),
+    ('education', 'TEXT'),
+    ('work_experience', 'TEXT'),
+    ('family_status', 'TEXT'),
+    ('specialty', 'TEXT'),
+    ('hobbies', 'TEXT'),
+    ('insurance', 'TEXT'),
+    ('vision', 'VARCHAR(20)'),
+    ('languages', 'TEXT'),
+    ('driver_license', 'TEXT'),
+    ('military_service', 'VARCHAR(20)'),
+    ('military_branch', 'VARCHAR(50)'),
+    ('certifications', 'TEXT'),
+    ('financial_reports', 'VARCHAR(10)'),
+    ('computer_skills', 'TEXT'),
+    ('insurance_items', 'TEXT'),
+    ('criminal_record', 'TEXT'),
+]
+
+# 拆分後 employee 只保留登入與身分欄位
+EMPLOYEE_TABLE_SQL = """
+    CREATE TABLE employee_new (
+        id INTEGER NOT NULL,
+        employee_id VARCHAR(20) NOT NULL,
+        username VARCHAR(80) NOT NULL,
+        password_hash VARCHAR(120) NOT NULL,
+        name VARCHAR(100) NOT NULL,
+        is_active BOOLEAN,
+        is_admin BOOLEAN,
+        created_at DATETIME,
+        PRIMARY KEY (id),
+        UNIQUE (employee_id),
+        UNIQUE (username)
+    )
+"""
+EMPLOYEE_COLUMNS = ['id', 'employee_id', 'username', 'password_hash', 'name', 'is_active', 'is_admin', 'created_at']
+
+def split_employee_profile(cursor):
+    """將 employee 的人事資料搬移到 employee_profile，並重建精簡的 employee 資料表"""
+    cursor.execute("PRAGMA table_info(employee)")
+    employee_columns = [column[1] for column in cursor.fetchall()]
+    moved_columns = [name for name, _ in PROFILE_COLUMNS if name in employee_columns]
+    if not moved_columns:
+        print("員工資料表已拆分")
+        return
+    
+    print("拆分員工人事資料到 employee_profile...")
+    column_definitions = ',\n        '.join(f"{name} {column_type}" for name, column_type in PROFILE_COLUMNS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS employee_profile (
+        id INTEGER NOT NULL,
+        {column_definitions},
+        PRIMARY KEY (id),
+        FOREIGN KEY(id) REFERENCES employee (id)
+    )""")
+    
+    # 新版程式在遷移前新增的員工已經有 employee_profile，保留不覆蓋
+    column_list = ', '.join(moved_columns)
+    cursor.execute(f"""
+        INSERT INTO employee_profile (id, {column_list})
+        SELECT id, {column_list} FROM employee
+        WHERE id NOT IN (SELECT id FROM employee_profile)
+    """)
+    
+    # 先建新表再改名，其他資料表的外鍵仍指向 employee
+    slim_columns = ', '.join(EMPLOYEE_COLUMNS)
+    cursor.execute(EMPLOYEE_TABLE_SQL)
+    cursor.execute(f"INSERT INTO employee_new ({slim_columns}) SELECT {slim_columns} FROM employee")
+    cursor.execute("DROP TABLE employee")
+    cursor.execute("ALTER TABLE employee_new RENAME TO employee")
+
+# 出勤記錄資料表加上 AUTOINCREMENT：封存資料表保留原本的 id，新記錄不可重複使用已搬移的 id
+ATTENDANCE_RECORD_TABLE_SQL = """
+    CREATE TABLE attendance_record_new (
+        id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        employee_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        clock_in_time DATETIME,
+        clock_out_time DATETIME,
+        clock_in_latitude FLOAT,
+        clock_in_longitude FLOAT,
+        clock_in_address VARCHAR(500),
+        clock_out_latitude FLOAT,
+        clock_out_longitude FLOAT,
+        clock_out_address VARCHAR(500),
+        clock_in_site_id INTEGER,
+        clock_in_on_site BOOLEAN,
+        clock_out_site_id INTEGER,
+        clock_out_on_site BOOLEAN,
+        FOREIGN KEY(employee_id) REFERENCES employee (id),
+        FOREIGN KEY(clock_in_site_id) REFERENCES work_site (id),
+        FOREIGN KEY(clock_out_site_id) REFERENCES work_site (id)
+    )
+"""
+ATTENDANCE_RECORD_COLUMNS = [
+    'id', 'employee_id', 'date', 'clock_in_time', 'clock_out_time',
+    'clock_in_latitude', 'clock_in_longitude', 'clock_in_address',
+    'clock_out_latitude', 'clock_out_longitude', 'clock_out_address',
+    'clock_in_site_id', 'clock_in_on_site', 'clock_out_site_id', 'clock_out_on_site',
+]
+
+def rebuild_attendance_autoincrement(cursor):
+    """重建沒有 AUTOINCREMENT 的 attendance_record，並將序號提高到已封存記錄的最大 id 之後"""
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'attendance_record'")
+    if 'AUTOINCREMENT' in cursor.fetchone()[0].upper():
+        print("出勤記錄資料表已使用 AUTOINCREMENT")
+        return
+    
+    print("重建出勤記錄資料表（AUTOINCREMENT）...")
+    column_list = ', '.join(ATTENDANCE_RECORD_COLUMNS)
+    cursor.execute(ATTENDANCE_RECORD_TABLE_SQL)
+    cursor.execute(f"INSERT INTO attendance_record_new ({column_list}) SELECT {column_list} FROM attendance_record")
+    # 觸發器與索引隨舊資料表刪除：索引稍後建立，觸發器由應用程式啟動時重建
+    cursor.execute("DROP TABLE attendance_record")
+    # 改名時不改寫其他觸發器與外鍵中的 attendance_record（舊資料表刪除後這些參照暫時無效）
+    cursor.execute("PRAGMA legacy_alter_table = ON")
+    cursor.execute("ALTER TABLE attendance_record_new RENAME TO attendance_record")
+    cursor.execute("PRAGMA legacy_alter_table = OFF")
+    
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM attendance_record")
+    max_id = cursor.fetchone()[0]
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'attendance_archive'")
+    if cursor.fetchone():
+        cursor.execute("SELECT table_name FROM attendance_archive")
+        for (table_name,) in cursor.fetchall():
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table_name}")
+            max_id = max(max_id, cursor.fetchone()[0])
+    cursor.execute("DELETE FROM sqlite_sequence WHERE name = 'attendance_record'")
+    cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('attendance_record', ?)", (max_id,))
+
+def merge_duplicate_attendance_records(cursor):
+    """合併同一員工同一天的重複出勤記錄：保留最小 ID，取最早的上班打卡與最晚的下班打卡"""
+    cursor.execute("""
+        SELECT employee_id, date FROM attendance_record
+        GROUP BY employee_id, date HAVING COUNT(*) > 1
+    """)
+    duplicates = cursor.fetchall()
+    
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'pending_geocode'")
+    has_pending_geocode = cursor.fetchone() is not None
+    
+    for employee_id, record_date in duplicates:
+        columns = ['id'] + CLOCK_IN_COLUMNS + CLOCK_OUT_COLUMNS
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM attendance_record WHERE employee_id = ? AND date = ? ORDER BY id",
+            (employee_id, record_date)
+        )
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        keep_id = rows[0]['id']
+        other_ids = [row['id'] for row in rows[1:]]
+        
+        values = {}
+        clock_ins = [row for row in rows if row['clock_in_time']]
+        if clock_ins:
+            earliest = min(clock_ins, key=lambda row: row['clock_in_time'])
+            values.update({column: earliest[column] for column in CLOCK_IN_COLUMNS})
+        clock_outs = [row for row in rows if row['clock_out_time']]
+        if clock_outs:
+            latest = max(clock_outs, key=lambda row: row['clock_out_time'])
+            values.update({column: latest[column] for column in CLOCK_OUT_COLUMNS})
+        
+        if values:
+            assignments = ', '.join(f"{column} = ?" for column in values)
+            cursor.execute(f"UPDATE attendance_record SET {assignments} WHERE id = ?", list(values.values()) + [keep_id])
+        
+        placeholders = ', '.join('?' for _ in other_ids)
+        if has_pending_geocode:
+            cursor.execute(f"UPDATE pending_geocode SET record_id = ? WHERE record_id IN ({placeholders})", [keep_id] + other_ids)
+        cursor.execute(f"DELETE FROM attendance_record WHERE id IN ({placeholders})", other_ids)
+        print(f"合併重複出勤記錄: 員工 {employee_id} {record_date}（刪除 {len(other_ids)} 筆）")
+
 def migrate_database():
-    """遷移資料庫，添加GPS位置欄位"""
+    """遷移資料庫，添加GPS位置欄位與索引"""
     
-    db_path = 'employee_management.db'
+    db_path = next((path for path in DB_PATHS if os.path.exists(path)), None)
     
-    if not os.path.exists(db_path):
+    if not db_path:
         print("資料庫檔案不存在，無需遷移")
         return
     
@@ -33,7 +234,11 @@ def migrate_database():
             ('clock_in_address', 'TEXT'),
             ('clock_out_latitude', 'REAL'),
             ('clock_out_longitude', 'REAL'),
-            ('clock_out_address', 'TEXT')
+            ('clock_out_address', 'TEXT'),
+            ('clock_in_site_id', 'INTEGER REFERENCES work_site(id)'),
+            ('clock_in_on_site', 'BOOLEAN'),
+            ('clock_out_site_id', 'INTEGER REFERENCES work_site(id)'),
+            ('clock_out_on_site', 'BOOLEAN')
         ]
         
         # 添加新欄位
@@ -44,6 +249,22 @@ def migrate_database():
             else:
                 print(f"欄位已存在: {column_name}")
         
+        # 拆分員工人事資料
+        split_employee_profile(cursor)
+        
+        # 唯一索引建立前先合併重複資料
+        merge_duplicate_attendance_records(cursor)
+        
+        # 加上 AUTOINCREMENT（重建資料表，索引於下方重新建立）
+        rebuild_attendance_autoincrement(cursor)
+        
+        # 建立索引
+        for index_name, table_name, index_columns, unique in INDEXES:
+            print(f"建立索引: {index_name}")
+            cursor.execute(
+                f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {index_name} ON {table_name} ({index_columns})"
+            )
+        
         conn.commit()
         print("資料庫遷移完成！")
         
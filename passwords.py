@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+密碼雜湊 - 在密碼程序池的子程序中執行的函式
+
+子程序以 spawn 啟動時只會匯入這個模組，不會重新匯入 app.py（初始化資料庫、啟動執行緒），
+因此這裡只能依賴 Werkzeug，不可匯入 app 或在匯入時執行任何動作。
+"""
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+
+def hash_password(password, method):
+    return generate_password_hash(password, method)
+
+
+def check_password(password_hash, password, method):
+    """驗證密碼，回傳 (是否正確, 需更新的新雜湊或 None)；已存雜湊的方法與 method 不同時重新雜湊"""
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if password_hash.split('$', 1)[0] == password_method_prefix(method):
+        return True, None
+    return True, generate_password_hash(password, method)
+
+
+def password_method_prefix(method):
+    """將雜湊方法補上 Werkzeug 的預設參數，以便與已存雜湊的前綴比較"""
+    name, *params = method.split(':')
+    if name == 'pbkdf2':
+        defaults = ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)]
+    elif name == 'scrypt':
+        defaults = ['32768', '8', '1']
+    else:
+        return method
+    return ':'.join([name] + params + defaults[len(params):])
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+測試設定 - 匯入 app 前改用暫存目錄中的 SQLite 資料庫與 instance 目錄，並停用背景地址轉換
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+from datetime import date, datetime
+
+import pytest
+
+_db_dir = tempfile.mkdtemp(prefix='employee-management-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.db')
+os.environ['INSTANCE_PATH'] = _db_dir
+os.environ['GEOCODE_QUEUE_ENABLED'] = '0'
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+
+_employee_numbers = itertools.count(1)
+
+
+@pytest.fixture(scope='session')
+def app():
+    app_module.app.config['TESTING'] = True
+    with app_module.app.app_context():
+        employee = app_module.Employee(
+            employee_id='E001', username='employee1', name='王小明',
+            password_hash=app_module.generate_password_hash('password', 'pbkdf2:sha256:1000')
+        )
+        app_module.db.session.add(employee)
+        app_module.db.session.flush()
+        app_module.db.session.add(app_module.AttendanceRecord(
+            employee_id=employee.id, date=date.today(),
+            clock_in_time=datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+        ))
+        app_module.db.session.commit()
+    return app_module.app
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+
+@pytest.fixture
+def make_employee(app):
+    """建立一名員工並回傳 (id, 員工編號)；編號以 T 開頭，不影響以 E00 搜尋的測試"""
+    def make():
+        number = next(_employee_numbers)
+        code = f'T{number:05d}'
+        with app.app_context():
+            employee = app_module.Employee(
+                employee_id=code, username=f'user-{code}', name=f'測試{number}',
+                password_hash=app_module.generate_password_hash('password', 'pbkdf2:sha256:1000')
+            )
+            app_module.db.session.add(employee)
+            app_module.db.session.commit()
+            return employee.id, code
+    return make
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+出勤記錄封存 - 搬移到封存資料表、id 不重複使用、跨分區分頁、刪除記錄與刪除工作地點
+"""
+
+from datetime import date, datetime, time, timedelta
+
+import pytest
+
+import app as app_module
+
+ARCHIVE_MONTHS = ('2020-01', '2020-02')
+
+
+@pytest.fixture
+def archive_cleanup(app):
+    """測試結束後移除封存資料表與登記，其他測試只查詢現行資料表"""
+    yield
+    with app.app_context():
+        for table in app_module.attendance_archives.tables():
+            table.drop(app_module.db.session.connection(), checkfirst=True)
+        app_module.db.session.execute(app_module.delete(app_module.AttendanceArchive))
+        app_module.db.session.commit()
+        app_module.attendance_archives.invalidate()
+
+
+def _add_records(employee_id, days, site_id=None):
+    """每一天新增一筆 08:00–17:00 的出勤記錄，回傳 id（呼叫端需在 app context 內）"""
+    records = [
+        app_module.AttendanceRecord(
+            employee_id=employee_id, date=day,
+            clock_in_time=datetime.combine(day, time(8)), clock_out_time=datetime.combine(day, time(17)),
+            clock_in_site_id=site_id
+        )
+        for day in days
+    ]
+    app_module.db.session.add_all(records)
+    app_module.db.session.commit()
+    return [record.id for record in records]
+
+
+def _archive(*months):
+    for month in months:
+        app_module._archive_attendance_month(month)
+    app_module.db.session.commit()
+    app_module.attendance_archives.invalidate()
+
+
+def _filters(employee_id, start_date=None, end_date=None):
+    return {'employee_id': employee_id, 'start_date': start_date, 'end_date': end_date, 'status': ''}
+
+
+def _days(first, count):
+    return [first + timedelta(days=offset) for offset in range(count)]
+
+
+def test_archived_ids_are_not_reused(app, make_employee, archive_cleanup):
+    employee_id, _ = make_employee()
+    with app.app_context():
+        # 封存的記錄是目前最大的 id，搬移後新記錄不可取得相同 id
+        archived_id, = _add_records(employee_id, [date(2020, 1, 15)])
+        _archive('2020-01')
+        assert app_module.db.session.get(app_module.AttendanceRecord, archived_id) is None
+
+        new_id, = _add_records(employee_id, [date.today() - timedelta(days=1)])
+        assert new_id > archived_id
+
+        # 依 id 刪除只影響封存資料表中的那一筆，並寫入刪除標記
+        assert app_module._delete_attendance_records_by_ids([archived_id]) == 1
+        app_module.db.session.commit()
+        assert app_module.db.session.get(app_module.AttendanceRecord, new_id) is not None
+        change = app_module.db.session.execute(
+            app_module.select(app_module.AttendanceChange.op)
+            .where(app_module.AttendanceChange.record_id == archived_id)
+        ).scalar()
+        assert change == 'delete'
+        archive = app_module.db.session.get(app_module.AttendanceArchive, '2020-01')
+        assert archive.row_count == 0
+
+
+def test_fetch_attendance_page_across_partitions(app, make_employee, archive_cleanup):
+    employee_id, _ = make_employee()
+    with app.app_context():
+        days = _days(date(2020, 1, 28), 8) + _days(date.today() - timedelta(days=3), 3)
+        _add_records(employee_id, days)
+        _archive(*ARCHIVE_MONTHS)
+
+        fetched = []
+        cursor = None
+        while True:
+            rows, next_cursor = app_module._fetch_attendance_page(
+                _filters(employee_id), 4, app_module._decode_attendance_cursor(cursor)
+            )
+            assert len(rows) <= 4
+            fetched += [row.date for row in rows]
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        assert fetched == sorted(days, reverse=True)
+
+        # 日期範圍只涵蓋一個封存月份時，只查詢該月份
+        rows, next_cursor = app_module._fetch_attendance_page(
+            _filters(employee_id, date(2020, 2, 1), date(2020, 2, 29)), 10
+        )
+        assert [row.date for row in rows] == sorted(_days(date(2020, 2, 1), 4), reverse=True)
+        assert next_cursor is None
+
+
+def test_delete_work_site_clears_archived_references(app, admin_client, make_employee, archive_cleanup):
+    employee_id, _ = make_employee()
+    with app.app_context():
+        site = app_module.WorkSite(name='封存測試地點', latitude=25.03, longitude=121.56, radius_m=100)
+        app_module.db.session.add(site)
+        app_module.db.session.commit()
+        site_id = site.id
+        archived_id, = _add_records(employee_id, [date(2020, 1, 10)], site_id=site_id)
+        _archive('2020-01')
+
+    response = admin_client.get(f'/delete_work_site/{site_id}')
+    assert response.status_code == 302
+
+    with app.app_context():
+        archive = app_module.attendance_archives.tables()[0]
+        row = app_module.db.session.execute(
+            app_module.select(archive.c.clock_in_site_id).where(archive.c.id == archived_id)
+        ).one()
+        assert row.clock_in_site_id is None
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+批次打卡 API - 重送、批次內重複、未知員工與同時上傳同一員工同一天的打卡
+"""
+
+import threading
+from datetime import date, datetime, time, timedelta
+
+import app as app_module
+
+
+def _punch(punch_id, employee_code, punch_type, at):
+    return {'id': punch_id, 'employee_id': employee_code, 'type': punch_type, 'timestamp': at.isoformat()}
+
+
+def _post_batch(client, *punches):
+    return client.post('/api/punches/batch', json={'device_id': 'kiosk-test', 'punches': list(punches)})
+
+
+def _yesterday(hour):
+    return datetime.combine(date.today() - timedelta(days=1), time(hour))
+
+
+def _attendance_rows(app, employee_id):
+    with app.app_context():
+        return app_module.db.session.execute(
+            app_module.select(app_module.AttendanceRecord.id, app_module.AttendanceRecord.clock_in_time,
+                              app_module.AttendanceRecord.clock_out_time)
+            .where(app_module.AttendanceRecord.employee_id == employee_id)
+        ).all()
+
+
+def test_replayed_punch_returns_previous_result(app, admin_client, make_employee):
+    employee_id, code = make_employee()
+    punch = _punch(f'{code}-in', code, 'clock_in', _yesterday(9))
+
+    first = _post_batch(admin_client, punch).get_json()
+    assert first['applied'] == 1
+    replay = _post_batch(admin_client, punch).get_json()
+
+    original, replayed = first['results'][0], replay['results'][0]
+    assert replayed['replayed'] is True
+    assert (replayed['status'], replayed['message'], replayed['record_id']) == \
+        (original['status'], original['message'], original['record_id'])
+    assert len(_attendance_rows(app, employee_id)) == 1
+
+
+def test_duplicate_punches_in_one_batch(app, admin_client, make_employee):
+    employee_id, code = make_employee()
+    response = _post_batch(
+        admin_client,
+        _punch(f'{code}-a', code, 'clock_in', _yesterday(9)),
+        _punch(f'{code}-a', code, 'clock_in', _yesterday(9)),
+        _punch(f'{code}-b', code, 'clock_in', _yesterday(10)),
+        _punch(f'{code}-c', code, 'clock_out', _yesterday(18)),
+    ).get_json()
+
+    statuses = [(result['status'], result['message']) for result in response['results']]
+    assert statuses == [
+        ('applied', '上班打卡成功'),
+        ('invalid', '同一批次中打卡 ID 重複'),
+        ('rejected', '今日已打卡上班'),
+        ('applied', '下班打卡成功'),
+    ]
+    (record,) = _attendance_rows(app, employee_id)
+    assert (record.clock_in_time, record.clock_out_time) == (_yesterday(9), _yesterday(18))
+
+
+def test_unknown_employee_is_invalid(admin_client):
+    response = _post_batch(admin_client, _punch('unknown-employee-punch', 'NO-SUCH-EMPLOYEE', 'clock_in', _yesterday(9)))
+    assert response.status_code == 200
+    result = response.get_json()['results'][0]
+    assert (result['status'], result['message']) == ('invalid', '找不到員工或帳號已停用')
+
+
+def test_concurrent_batches_for_same_employee_day(app, admin_client, make_employee, monkeypatch):
+    employee_id, code = make_employee()
+    other_client = app.test_client()
+    other_client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+    other_responses = []
+    interleaved = threading.Event()
+    write_records = app_module._write_punch_batch_records
+
+    def write_after_other_batch(records):
+        # 第一個批次讀取完出勤記錄、尚未寫入時，另一個請求先完成同一員工同一天的打卡
+        if not interleaved.is_set():
+            interleaved.set()
+            thread = threading.Thread(target=lambda: other_responses.append(
+                _post_batch(other_client, _punch(f'{code}-other', code, 'clock_in', _yesterday(8)))
+            ))
+            thread.start()
+            thread.join()
+        return write_records(records)
+
+    monkeypatch.setattr(app_module, '_write_punch_batch_records', write_after_other_batch)
+    response = _post_batch(admin_client, _punch(f'{code}-first', code, 'clock_in', _yesterday(9)))
+
+    assert other_responses[0].get_json()['applied'] == 1
+    assert response.status_code == 409
+    (record,) = _attendance_rows(app, employee_id)
+    assert record.clock_in_time == _yesterday(8)
+
+    # 衝突的批次整批回復，重新上傳時依最新資料判定
+    monkeypatch.setattr(app_module, '_write_punch_batch_records', write_records)
+    retry = _post_batch(admin_client, _punch(f'{code}-first', code, 'clock_in', _yesterday(9))).get_json()
+    assert (retry['results'][0]['status'], retry['results'][0]['replayed']) == ('rejected', False)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+各路由的 SQL 陳述式數量 - 以請求指標已累計的 g.sql_statements 檢查，避免新增 N+1 查詢
+"""
+
+from contextlib import contextmanager
+
+from flask import g, request_finished
+
+
+@contextmanager
+def assert_sql_statements(app, expected):
+    """斷言區塊內的請求共執行 expected 個 SQL 陳述式"""
+    counts = []
+
+    def record(sender, response, **extra):
+        counts.append(g.sql_statements)
+
+    with request_finished.connected_to(record, app):
+        yield
+    assert sum(counts) == expected, f'預期執行 {expected} 個 SQL 陳述式，實際執行 {sum(counts)} 個'
+
+
+def _get_warm(client, url):
+    """先請求一次，讓登入者快取與表格片段快取就緒"""
+    assert client.get(url).status_code == 200
+
+
+def test_employee_management_reads_only_table_versions(app, admin_client):
+    _get_warm(admin_client, '/employee_management')
+    with assert_sql_statements(app, 1):
+        assert admin_client.get('/employee_management').status_code == 200
+
+
+def test_employee_management_not_modified(app, admin_client):
+    etag = admin_client.get('/employee_management').headers['ETag']
+    with assert_sql_statements(app, 1):
+        response = admin_client.get('/employee_management', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+def test_search_employees(app, admin_client):
+    _get_warm(admin_client, '/search_employees?q=E00')
+    # 資料表版本，以及前綴相符不足一頁時補上的全文索引查詢
+    with assert_sql_statements(app, 2):
+        response = admin_client.get('/search_employees?q=E00')
+    assert [employee['employee_id'] for employee in response.get_json()['employees']] == ['E001']
+
+
+def test_attendance_records(app, admin_client):
+    _get_warm(admin_client, '/attendance_records')
+    with assert_sql_statements(app, 2):
+        assert admin_client.get('/attendance_records').status_code == 200
+
+
+def test_excel_export(app, admin_client):
+    _get_warm(admin_client, '/export_attendance_excel')
+    with assert_sql_statements(app, 2):
+        response = admin_client.get('/export_attendance_excel')
+    assert response.status_code == 200